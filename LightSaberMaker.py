@@ -14,70 +14,483 @@ GNU General Public License for more details.
 You should have received a copy of the GNU General Public License
 along with this program.  If not, see <https://www.gnu.org/licenses/>.
 '''
-import bpy
-import bmesh
+import argparse
+import csv
+import hashlib
+import importlib
+import inspect
+import itertools
+import json
+import multiprocessing
+import os
+import re
+import shutil
+import sys
+import time
+import tracemalloc
+import types
+from contextlib import contextmanager, nullcontext
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+try:
+    from multiprocessing import shared_memory
+except ImportError:
+    # Python before 3.8, as in Blender before 2.93: threads are made on one
+    # core.
+    shared_memory = None
 from math import *
 
-def createMeshFromData(name, origin, verts, edges, faces):
+# Lets Blender install this file as an add-on, with a LightSaber tab in the
+# 3D view's sidebar. Run as a script it works as before.
+bl_info = {
+    'name': 'LightSaber Maker',
+    'author': 'Daniel Stewart',
+    'version': (1, 0),
+    'blender': (2, 80, 0),
+    'location': 'View3D > Sidebar > LightSaber',
+    'description': 'Makes printable lightsaber hilt, pommel, blade holder and adapter parts',
+    'category': 'Add Mesh',
+}
+
+class StageLog:
+    # Opt-in record of where the time goes: wall time, vertex and face
+    # counts, vertices folded away by resolveShared and peak allocation of
+    # every stage of making each part. Record with
+    #   log = startStageLog()
+    #   ... make parts ...
+    #   stopStageLog()
+    #   print(log.table())
+    # or save log.records as JSON.
+    def __init__(self):
+        self.records = []
+        self.open = []
+
+    @contextmanager
+    def stage(self, name, part=None):
+        record = {'part': part or (self.open[-1]['part'] if self.open else None), 'stage': name, 'depth': len(self.open)}
+        self.records.append(record)
+        # The tracemalloc peak is reset at every stage boundary, so fold it
+        # into every open stage first.
+        self.foldPeak()
+        record['start'] = record['peak'] = tracemalloc.get_traced_memory()[0]
+        self.open.append(record)
+        start = time.perf_counter()
+        try:
+            yield record
+        finally:
+            record['seconds'] = time.perf_counter() - start
+            self.foldPeak()
+            self.open.pop()
+            record['peakBytes'] = record.pop('peak') - record.pop('start')
+
+    def foldPeak(self):
+        peak = tracemalloc.get_traced_memory()[1]
+        for record in self.open:
+            record['peak'] = max(record['peak'], peak)
+        # Before Python 3.9 the peak can't be reset, so every stage reports
+        # the peak since recording began.
+        if hasattr(tracemalloc, 'reset_peak'):
+            tracemalloc.reset_peak()
+
+    def table(self):
+        lines = ['%-24s %9s %8s %8s %7s %8s' % ('stage', 'ms', 'verts', 'faces', 'welded', 'peak MB')]
+        part = None
+        for record in self.records:
+            if record['depth'] == 0 and record['part'] != part:
+                part = record['part']
+                lines.append(part or '')
+            lines.append('%-24s %9.2f %8s %8s %7s %8.1f' % ('  ' * (record['depth'] + 1) + record['stage'], record['seconds'] * 1000,
+                         record.get('verts', ''), record.get('faces', ''), record.get('welded', ''), record['peakBytes'] / 2**20))
+        return '\n'.join(lines)
+
+stageLog = None
+
+def startStageLog():
+    global stageLog
+    tracemalloc.start()
+    stageLog = StageLog()
+    return stageLog
+
+def stopStageLog():
+    global stageLog
+    tracemalloc.stop()
+    log, stageLog = stageLog, None
+    return log
+
+def stage(name, part=None):
+    # A stage of making a part, as a with block that gives a dict for its
+    # counts. Does nothing unless a StageLog is recording.
+    if stageLog is None:
+        return nullcontext({})
+    return stageLog.stage(name, part)
+
+class MeshBuffer:
+    # Packed storage for one part: float32 coordinates and int32 quad indices.
+    # A triangle stores -1 in its last slot. The only larger faces are the
+    # N + 2 sided caps at each end of a thread, kept separately in ngons.
+    def __init__(self, numVerts, numFaces):
+        self.verts = np.zeros((numVerts, 3), dtype=np.float32)
+        self.faces = np.zeros((numFaces, 4), dtype=np.int32)
+        self.ngons = {}
+        # shared[i] is the vertex that vertex i really is. The builders lay
+        # out their sections independently and record here where two sections
+        # meet, so no welding by distance is ever needed.
+        self.shared = np.arange(numVerts)
+        # (first face, name) of every thread and band, in face order, so a
+        # problem found in the finished mesh can be traced to the outline.
+        self.sections = []
+
+    def __getstate__(self):
+        # Only the finished buffers travel between processes; shared is just
+        # the identity again once resolveShared has run.
+        return self.verts, self.faces, self.ngons, self.sections
+
+    def __setstate__(self, state):
+        self.verts, self.faces, self.ngons, self.sections = state
+        self.shared = np.arange(len(self.verts))
+
+    def resolveShared(self):
+        # Fold every shared vertex into the one it stands for, renumber, and
+        # drop the faces that collapse to an edge or a point on the way.
+        shared = self.shared
+        while True:
+            folded = shared[shared]
+            if np.array_equal(folded, shared):
+                break
+            shared = folded
+        keep = shared == np.arange(len(shared))
+        index = np.cumsum(keep) - 1
+        self.verts = self.verts[keep]
+
+        # A triangle's empty slot becomes a repeat of its last corner, which
+        # the repeated corner check below turns back into a triangle.
+        faces = np.where(self.faces < 0, self.faces[:, 2:3], self.faces)
+        faces = index[shared[faces]]
+        repeated = faces == np.roll(faces, 1, axis=1)
+        order = np.argsort(repeated, axis=1, kind='stable')
+        faces = np.take_along_axis(faces, order, axis=1)
+        faces[repeated.sum(axis=1) == 1, 3] = -1
+        alive = repeated.sum(axis=1) < 2
+
+        ngons = {}
+        for face, ngon in self.ngons.items():
+            ngon = [int(index[shared[v]]) for v in ngon]
+            ngon = [v for k, v in enumerate(ngon) if v != ngon[k - 1]]
+            alive[face] = len(ngon) >= 3
+            if alive[face]:
+                ngons[face] = ngon
+        faceIndex = np.cumsum(alive) - 1
+        self.faces = faces[alive].astype(np.int32)
+        self.ngons = {int(faceIndex[face]): ngon for face, ngon in ngons.items()}
+        before = np.concatenate(([0], np.cumsum(alive)))
+        self.sections = [(int(before[first]), name) for first, name in self.sections]
+        self.shared = np.arange(len(self.verts))
+
+    def packLoops(self):
+        # Flatten the faces into the loop layout Blender uses internally.
+        loopTotal = np.where(self.faces[:, 3] < 0, 3, 4).astype(np.int32)
+        for face, ngon in self.ngons.items():
+            loopTotal[face] = len(ngon)
+        loopStart = np.zeros(len(self.faces), dtype=np.int32)
+        np.cumsum(loopTotal[:-1], out=loopStart[1:])
+
+        loops = np.empty(loopTotal.sum(), dtype=np.int32)
+        small = np.ones(len(self.faces), dtype=bool)
+        small[list(self.ngons)] = False
+        corner = np.arange(4) < loopTotal[small, None]
+        loops[(loopStart[small, None] + np.arange(4))[corner]] = self.faces[small][corner]
+        for face, ngon in self.ngons.items():
+            loops[loopStart[face]:loopStart[face] + len(ngon)] = ngon
+        return loops, loopStart, loopTotal
+
+    def triangles(self):
+        return self.triangleFaces()[0]
+
+    def triangleFaces(self):
+        # Split every face into a fan of triangles from its first corner, in
+        # face order, and say which face each triangle came from. Keeping to
+        # face order means the chunks of streamOutline give the same
+        # triangles as the whole part.
+        loops, loopStart, loopTotal = self.packLoops()
+        owners = np.repeat(np.arange(len(self.faces)), loopTotal - 2)
+        fan = np.arange(len(owners)) - np.repeat(np.cumsum(loopTotal - 2) - (loopTotal - 2), loopTotal - 2) + 1
+        start = loopStart[owners]
+        return loops[np.stack([start, start + fan, start + fan + 1], axis=1)], owners
+
+    def sectionOf(self, faces):
+        # Which of the sections each of the given faces belongs to.
+        starts = np.array([first for first, name in self.sections] or [0])
+        return np.searchsorted(starts, faces, side='right') - 1
+
+    def sectionNames(self, faces):
+        names = [name for first, name in self.sections] or ['the mesh']
+        return [names[i] for i in np.unique(self.sectionOf(faces))]
+
+# One triangle of a binary STL file.
+STL_FACET = np.dtype([('normal', '<f4', 3), ('corners', '<f4', (3, 3)), ('attribute', '<u2')])
+
+def readSTL(filename):
+    # The corners of the triangles of a binary STL file, as a read only
+    # (triangles, 3, 3) array. The file is mapped rather than read, so
+    # nothing is copied until the corners are used.
+    size = os.path.getsize(filename)
+    with open(filename, 'rb') as f:
+        f.seek(80)
+        count = int(np.frombuffer(f.read(4).ljust(4, b'\0'), '<u4')[0])
+    if size < 84 or size != 84 + count * STL_FACET.itemsize:
+        raise ValueError('%s is not a binary STL file' % filename)
+    if not count:
+        return np.empty((0, 3, 3), dtype=np.float32)
+    return np.memmap(filename, STL_FACET, 'r', 84, (count,))['corners']
+
+def writeSTL(filename, mesh, name=''):
+    # mesh can also be any iterable of MeshBuffers, such as streamOutline
+    # gives, which are written one after another as a single part.
+    with stage('writeSTL') as record:
+        record['faces'] = writeFacets(filename, [mesh] if isinstance(mesh, MeshBuffer) else mesh, name)
+    return record['faces']
+
+def writeFacets(filename, meshes, name):
+    # Binary STL in the same scale Blender exports by default, 1 unit = 1 mm.
+    # The triangle count in the header is filled in once they are all written.
+    count = 0
+    with open(filename, 'wb') as f:
+        f.write(('LightSaberMaker ' + name).encode('ascii')[:80].ljust(80, b' '))
+        f.write(np.uint32(0).tobytes())
+        for mesh in meshes:
+            corners = mesh.verts[mesh.triangles()]
+            normals = np.cross(corners[:, 1] - corners[:, 0], corners[:, 2] - corners[:, 0])
+            length = np.linalg.norm(normals, axis=1, keepdims=True)
+            np.divide(normals, length, out=normals, where=length > 0)
+
+            facets = np.zeros(len(corners), dtype=STL_FACET)
+            facets['normal'] = normals
+            facets['corners'] = corners
+            f.write(facets.tobytes())
+            count += len(facets)
+        f.seek(80)
+        f.write(np.uint32(count).tobytes())
+    return count
+
+# Thinnest wall in mm validateMesh lets through: two perimeters of a 0.4 mm
+# nozzle.
+MIN_WALL = 0.8
+
+def validateMesh(mesh, minWall=MIN_WALL, planes=4, step=0.25):
+    # Check a finished part before it goes to the printer and return a list
+    # of the problems found, each naming the threads and bands at fault:
+    # edges that aren't shared by exactly two faces running opposite ways,
+    # the holes such edges leave, surfaces that cross, and walls thinner than
+    # minWall. Walls are measured along the radius every step mm up the
+    # part, on 2 * planes half planes through the axis.
+    problems = []
+    def where(faces):
+        return '; '.join(mesh.sectionNames(faces))
+
+    # Every edge of every face, once from each side when the mesh is closed.
+    loops, loopStart, loopTotal = mesh.packLoops()
+    owner = np.repeat(np.arange(len(mesh.faces)), loopTotal)
+    following = np.arange(1, len(loops) + 1)
+    following[loopStart + loopTotal - 1] = loopStart
+    a = loops.astype(np.int64)
+    b = a[following]
+    edges = np.minimum(a, b) * len(mesh.verts) + np.maximum(a, b)
+    order = np.argsort(edges, kind='stable')
+    first = np.flatnonzero(np.diff(edges[order], prepend=-1))
+    uses = np.diff(np.append(first, len(order)))
+
+    crowded = order[np.repeat(uses > 2, uses)]
+    if len(crowded):
+        problems.append('%d edges are shared by more than two faces in %s' % (len(np.unique(edges[crowded])), where(owner[crowded])))
+    pairs = np.stack([order[first[uses == 2]], order[first[uses == 2] + 1]])
+    flipped = pairs[:, a[pairs[0]] == a[pairs[1]]]
+    if flipped.size:
+        problems.append('%d edges join faces facing opposite ways in %s' % (flipped.shape[1], where(owner[flipped])))
+
+    # The edges used only once run around holes. Label every vertex on a
+    # hole with the lowest vertex on it by pointer jumping along the holes.
+    loose = order[first[uses == 1]]
+    if len(loose):
+        jump = np.arange(len(mesh.verts))
+        jump[a[loose]] = b[loose]
+        label = np.arange(len(mesh.verts))
+        for _ in range(int(np.log2(len(loose))) + 2):
+            label = np.minimum(label, label[jump])
+            jump = jump[jump]
+        holes = label[a[loose]]
+        for hole in np.unique(holes):
+            edge = loose[holes == hole]
+            centre = mesh.verts[a[edge]].astype(np.float64)
+            problems.append('hole of %d edges around (r %.2f, z %.2f) in %s' % (len(edge), np.hypot(centre[:, 0], centre[:, 1]).mean(),
+                                                                                 centre[:, 2].mean(), where(owner[edge])))
+
+    # Cut the part with planes through the axis. Going out along the radius
+    # at each level the cut must alternate between entering the part, where
+    # the surface faces the axis, and leaving it. Each pair is a wall.
+    verts = mesh.verts.astype(np.float64)
+    triangles, triangleFace = mesh.triangleFaces()
+    low = verts[:, 2].min()
+    # The odd offsets keep the planes and levels off the vertices.
+    levels = low + (np.arange(int((verts[:, 2].max() - low) / step) + 1) + 0.4713) * step
+    walls = []
+    crossed = []
+    for k in range(planes):
+        theta = (k + 0.3183) * pi / planes
+        c, s = cos(theta), sin(theta)
+        side = verts[:, 1] * c - verts[:, 0] * s >= 0
+        sides = side[triangles]
+        cut = np.flatnonzero(sides.any(axis=1) & ~sides.all(axis=1))
+        corners = verts[triangles[cut]]
+        distance = corners[:, :, 1] * c - corners[:, :, 0] * s
+        nextCorners = np.roll(corners, -1, axis=1)
+        nextDistance = np.roll(distance, -1, axis=1)
+        crosses = (distance >= 0) != (nextDistance >= 0)
+        t = distance / np.where(crosses, distance - nextDistance, 1)
+        points = corners + t[:, :, None] * (nextCorners - corners)
+        ends = np.take_along_axis(points, np.argsort(~crosses, axis=1, kind='stable')[:, :2, None], axis=1)
+        u = ends[:, :, 0] * c + ends[:, :, 1] * s
+        normal = np.cross(corners[:, 1] - corners[:, 0], corners[:, 2] - corners[:, 0])
+        half = u.sum(axis=1) < 0
+        entering = (normal[:, 0] * c + normal[:, 1] * s < 0) != half
+        r = np.abs(u)
+        z = ends[:, :, 2]
+
+        # Every level each cut segment spans.
+        bottom = np.searchsorted(levels, z.min(axis=1))
+        count = np.searchsorted(levels, z.max(axis=1)) - bottom
+        segment = np.repeat(np.arange(len(cut)), count)
+        level = np.arange(len(segment)) - np.repeat(np.cumsum(count) - count, count) + bottom[segment]
+        radius = r[segment, 0] + (levels[level] - z[segment, 0]) * (r[segment, 1] - r[segment, 0]) / (z[segment, 1] - z[segment, 0])
+
+        ray = (2 * k + half[segment]) * len(levels) + level
+        outwards = np.lexsort((radius, ray))
+        ray, radius, segment, level = ray[outwards], radius[outwards], segment[outwards], level[outwards]
+        start = np.flatnonzero(np.diff(ray, prepend=-1))
+        size = np.diff(np.append(start, len(ray)))
+        position = np.arange(len(ray)) - np.repeat(start, size)
+        wrong = (entering[segment] != (position % 2 == 0)) | np.repeat(size % 2 == 1, size)
+        crossed.append((level[wrong], triangleFace[cut[segment[wrong]]]))
+        wall = np.flatnonzero((position % 2 == 0) & (position + 1 < np.repeat(size, size)) & ~np.repeat(np.add.reduceat(wrong, start) > 0, size))
+        walls.append((level[wall], radius[wall + 1] - radius[wall], triangleFace[cut[segment[wall]]], triangleFace[cut[segment[wall + 1]]]))
+
+    level, face = [np.concatenate(column) for column in zip(*crossed)]
+    if len(level) and not len(loose):
+        problems.append('surfaces cross or face inwards at z %.2f-%.2f in %s' % (levels[level.min()], levels[level.max()], where(face)))
+    level, thickness, inner, outer = [np.concatenate(column) for column in zip(*walls)]
+    thin = thickness < minWall - 1e-6
+    level, thickness, inner, outer = level[thin], thickness[thin], mesh.sectionOf(inner[thin]), mesh.sectionOf(outer[thin])
+    names = [name for first, name in mesh.sections] or ['the mesh']
+    pair = inner * len(names) + outer
+    found = []
+    for key in np.unique(pair):
+        match = pair == key
+        found.append((thickness[match].min(), 'wall only %.2f mm thick at z %.2f-%.2f between %s and %s' % (
+            thickness[match].min(), levels[level[match].min()], levels[level[match].max()], names[key // len(names)], names[key % len(names)])))
+    problems += [problem for _, problem in sorted(found)]
+    return problems
+
+def meshMeasure(mesh):
+    # Volume in mm³ and surface area in mm² of a closed mesh, straight from
+    # its triangles.
+    corners = mesh.verts[mesh.triangles()].astype(np.float64)
+    normals = np.cross(corners[:, 1] - corners[:, 0], corners[:, 2] - corners[:, 0])
+    return np.einsum('ij,ij->', corners[:, 0], normals) / 6, np.linalg.norm(normals, axis=1).sum() / 2
+
+def createMeshFromData(name, origin, mesh):
+    import bpy
     # Create mesh and object
-    mesh = bpy.data.meshes.new(name+'Mesh')
-    ob = bpy.data.objects.new(name, mesh)
+    me = bpy.data.meshes.new(name+'Mesh')
+    ob = createObject(name, origin, me)
+    fillMesh(me, mesh)
+    return ob
+
+def createObject(name, origin, me):
+    # An object showing the mesh datablock me, which other objects may show
+    # too.
+    import bpy
+    ob = bpy.data.objects.new(name, me)
     ob.location = origin
     ob.show_name = False
     # Link object to scene and make active
     bpy.context.collection.objects.link(ob)
     ob.select_set(True)
-    # Create mesh from given verts, faces.
-    mesh.from_pydata(verts, edges, faces)
-    bm = bmesh.new()
-    bm.from_mesh(mesh)
-    bmesh.ops.remove_doubles(bm, verts=bm.verts, dist=0.0001)
-    bmesh.ops.recalc_face_normals(bm, faces=bm.faces)
-    bm.to_mesh(mesh)
-    mesh.update()
-    bm.clear()
-
-    bm.free()
-    # Update mesh with new data
-    mesh.update()
-
-def createCircularPolys(VerticesPerLoop, verts, faces, radius, zoffset, startVert, startFace, joinVert, joinFace):
-    angle = 0
-    for i in range(VerticesPerLoop):
-        angle = i * 2 * pi / VerticesPerLoop
-        x = radius * cos(angle)
-        y = radius * sin(angle)
-        z = zoffset
-       
-        verts[startVert + i][0] = x
-        verts[startVert + i][1] = y
-        verts[startVert + i][2] = z
-   
-    for i in range(VerticesPerLoop - 1):
-        faces[startFace + i][0] = startVert + i
-        faces[startFace + i][1] = startVert + i + 1
-        faces[startFace + i][2] = joinVert + 1 + i
-        faces[startFace + i][3] = joinVert + i
-   
-    faces[startFace + VerticesPerLoop - 1][0] = startVert + VerticesPerLoop - 1
-    faces[startFace + VerticesPerLoop - 1][1] = startVert
-    faces[startFace + VerticesPerLoop - 1][2] = joinVert
-    faces[startFace + VerticesPerLoop - 1][3] = joinVert + VerticesPerLoop - 1
-   
-def joinCircularPolys(VerticesPerLoop, verts, faces, startVert, startFace, joinVert):
-    for i in range(VerticesPerLoop - 1):
-        faces[startFace + i][0] = startVert + i
-        faces[startFace + i][1] = startVert + i + 1
-        faces[startFace + i][2] = joinVert + 1 + i
-        faces[startFace + i][3] = joinVert + i
-   
-    faces[startFace + VerticesPerLoop - 1][0] = startVert + VerticesPerLoop - 1
-    faces[startFace + VerticesPerLoop - 1][1] = startVert
-    faces[startFace + VerticesPerLoop - 1][2] = joinVert
-    faces[startFace + VerticesPerLoop - 1][3] = joinVert + VerticesPerLoop - 1
-
-def createThreads(VerticesPerLoop, verts, faces, startVert, startFace, Loops, R, r, h1, h2, h3, h4, falloffRate, zoffset, femaleThreads = False):
-    # Code
+    return ob
+
+def replaceMeshData(ob, mesh):
+    # Give an existing part new geometry in the same mesh datablock, so
+    # regenerating it leaves nothing behind.
+    import bpy
+    me = ob.data
+    if me.users > 1:
+        # Other objects share this mesh and keep it; this one gets its own.
+        ob.data = bpy.data.meshes.new(me.name)
+        fillMesh(ob.data, mesh)
+    elif hasattr(me, 'clear_geometry'):
+        me.clear_geometry()
+        fillMesh(me, mesh)
+    else:
+        # Blender 2.80 can't empty a mesh, so swap in a new one instead.
+        ob.data = bpy.data.meshes.new(me.name)
+        bpy.data.meshes.remove(me)
+        fillMesh(ob.data, mesh)
+
+def fillMesh(me, mesh):
+    import bpy
+    # Copy the packed buffers straight into the empty mesh.
+    with stage('packLoops') as record:
+        loops, loopStart, loopTotal = mesh.packLoops()
+        record['faces'] = len(loopTotal)
+    with stage('foreach_set') as record:
+        me.vertices.add(len(mesh.verts))
+        me.loops.add(len(loops))
+        me.polygons.add(len(loopTotal))
+        me.vertices.foreach_set('co', mesh.verts.ravel())
+        me.loops.foreach_set('vertex_index', loops)
+        me.polygons.foreach_set('loop_start', loopStart)
+        # Since Blender 4.0 the polygon sizes follow from loop_start alone.
+        if bpy.app.version < (4, 0, 0):
+            me.polygons.foreach_set('loop_total', loopTotal)
+        record['verts'] = len(mesh.verts)
+        record['faces'] = len(loopTotal)
+    # The builders share vertices where sections meet and wind every face
+    # outwards, so there is nothing to weld or recalculate here.
+    with stage('update'):
+        me.update(calc_edges=True)
+
+def circleVerts(VerticesPerLoop, radius, zoffset):
+    # Rings of vertices, one for each radius/zoffset pair, evaluated for every
+    # angle at once.
+    angle = np.arange(VerticesPerLoop) * 2 * pi / VerticesPerLoop
+    radius = np.asarray(radius, dtype=float)[..., None]
+    ring = np.empty(radius.shape[:-1] + (VerticesPerLoop, 3))
+    ring[..., 0] = radius * np.cos(angle)
+    ring[..., 1] = radius * np.sin(angle)
+    ring[..., 2] = np.asarray(zoffset, dtype=float)[..., None]
+    return ring
+
+def circleFaces(VerticesPerLoop, startVert, joinVert):
+    # Quads between pairs of rings, wrapping the last quad back to the first
+    # vertex. Walking from the start ring to the join ring in the (radius, z)
+    # plane they face to the right.
+    i = np.arange(VerticesPerLoop)
+    j = (i + 1) % VerticesPerLoop
+    startVert = np.asarray(startVert)[..., None]
+    joinVert = np.asarray(joinVert)[..., None]
+    return np.stack((startVert + i, startVert + j, joinVert + j, joinVert + i), axis=-1)
+
+def threadFalloff(u, R, r, falloffRate):
+    # Radius of the crest of a thread u of the way along it. Written this way
+    # it is exactly r at both ends, so the thread runs out smoothly.
+    return r + (R - r) * (1 - 3 * np.power(2 * u - 1, falloffRate * 4) + 2 * np.power(2 * u - 1, falloffRate * 6))
+
+def threadSize(VerticesPerLoop, Loops, h2, h4):
+    # Profile points, vertices and faces of a thread.
+    N = 3 + (h2 > 0) + (h4 > 0)
+    return N, N * (VerticesPerLoop * Loops + 1) + 2 * VerticesPerLoop, (N - 1) * VerticesPerLoop * Loops + 2 * VerticesPerLoop
+
+def threadRows(first, last, VerticesPerLoop, Loops, R, r, h1, h2, h3, h4, falloffRate, zoffset, femaleThreads=False):
+    # Rows first to last of the helix of a thread. Every helix step is a row,
+    # every profile point a column.
     H = h1 + h2 + h3 + h4
 
     #build array of profile points
@@ -89,624 +502,1655 @@ def createThreads(VerticesPerLoop, verts, faces, startVert, startFace, Loops, R,
     ProfilePoints.append( [r, 0, h1 + h2 + h3] )
     if h4 > 0:
         ProfilePoints.append( [r, 0, h1 + h2 + h3 + h4] )
+    profile = np.array(ProfilePoints)
 
-    N = len(ProfilePoints)
-
-    # Create the bottom row
-    angle = 0
-    for i in range(VerticesPerLoop):
-        angle = i * 2 * pi / VerticesPerLoop
-        radius = r
-        x = radius * cos(angle)
-        y = radius * sin(angle)
-        z = zoffset
-       
-        verts[startVert + i][0] = x
-        verts[startVert + i][1] = y
-        verts[startVert + i][2] = z
-
-    faces[startFace][0] = startVert
-    faces[startFace][1] = startVert + VerticesPerLoop
-    faces[startFace][2] = startVert + VerticesPerLoop + N
-    faces[startFace][3] = startVert + 1
-
-    for i in range(1,VerticesPerLoop-1):
-        faces[startFace + i][0] = startVert + i
-        faces[startFace + i][1] = startVert + i * N + VerticesPerLoop
-        faces[startFace + i][2] = startVert + i * N + VerticesPerLoop + N
-        faces[startFace + i][3] = startVert + i + 1
-
-    # Just to ensure we have the right size
-    faces[startFace + VerticesPerLoop - 1] = [0 for _ in range(N+2)]
-   
-    # This one face has N + 2 vertices, not just 4.
-    faces[startFace + VerticesPerLoop - 1][0] = startVert + VerticesPerLoop - 1
-    faces[startFace + VerticesPerLoop - 1][1] = startVert + (VerticesPerLoop - 2) * N + VerticesPerLoop + N
-    for i in range(1,N):
-        faces[startFace + VerticesPerLoop - 1][i+1] =  startVert + VerticesPerLoop + (N - i)
-    faces[startFace + VerticesPerLoop - 1][N+1] = startVert + VerticesPerLoop
+    i = np.arange(first, last)
+    angle = i * 2 * pi / VerticesPerLoop
+    # falloff applies to outer rings only, so the first and last rows lie
+    # exactly on radius r.
+    falloff = threadFalloff(i / (VerticesPerLoop * Loops), R, r, falloffRate)
+    radius = np.where(profile[:, 0] == R, falloff[:, None], r)
 
-    # Here we actually create the threads.
-    # go around a circle. for each point in ProfilePoints array, create a vertex
-    angle = 0
-    zMax = ProfilePoints[N-1][2] + (Loops - 1) * H + zoffset
-    for i in range(VerticesPerLoop * Loops + 1):
-        for j in range(N):
-            angle = i * 2 * pi / VerticesPerLoop
-            # falloff applies to outer rings only
-            u = i / (VerticesPerLoop * Loops)
-            radius = r + (R - r) * (1 - 6*(pow(2 * u - 1, falloffRate * 4)/2 - pow(2 * u - 1, falloffRate * 6)/3)) if ProfilePoints[j][0] == R else r
-
-            x = radius * cos(angle)
-            y = radius * sin(angle)
-            z = ProfilePoints[j][2] + i / VerticesPerLoop * H + zoffset
-            # Check for maxing out if necessary
-            if femaleThreads and (z > zMax):
-                z = zMax
-
-            verts[startVert + N*i + j + VerticesPerLoop][0] = x
-            verts[startVert + N*i + j + VerticesPerLoop][1] = y
-            verts[startVert + N*i + j + VerticesPerLoop][2] = z
-    # now build face array
-    for i in range(VerticesPerLoop * Loops):
-        for j in range(N - 1):
-            faces[startFace + (N - 1) * i + j + VerticesPerLoop][0] = startVert + N * i + j + VerticesPerLoop
-            faces[startFace + (N - 1) * i + j + VerticesPerLoop][1] = startVert + N * i + 1 + j + VerticesPerLoop
-            faces[startFace + (N - 1) * i + j + VerticesPerLoop][2] = startVert + N * (i + 1) + 1 + j + VerticesPerLoop
-            faces[startFace + (N - 1) * i + j + VerticesPerLoop][3] = startVert + N * (i + 1) + j + VerticesPerLoop
-
-    # Now create the top edge
-    angle = 0
-    for i in range(VerticesPerLoop):
-        angle = i * 2 * pi / VerticesPerLoop
-        radius = r
-        x = radius * cos(angle)
-        y = radius * sin(angle)
+    helix = np.empty((len(i), len(profile), 3))
+    helix[:, :, 0] = radius * np.cos(angle)[:, None]
+    helix[:, :, 1] = radius * np.sin(angle)[:, None]
+    helix[:, :, 2] = profile[:, 2] + (i / VerticesPerLoop * H)[:, None] + zoffset
+    # Check for maxing out if necessary
+    if femaleThreads:
+        np.minimum(helix[:, :, 2], Loops * H + zoffset, out=helix[:, :, 2])
+    return helix
+
+def threadVerts(first, last, VerticesPerLoop, Loops, R, r, h1, h2, h3, h4, falloffRate, zoffset, femaleThreads=False):
+    # Vertices first to last of a thread, numbered from 0 the way
+    # createThreads lays them out: a ring at the bottom, the helix, and a
+    # ring at the top. Returns their coordinates and, for each, the vertex
+    # it really is.
+    H = h1 + h2 + h3 + h4
+    N, numVerts, numFaces = threadSize(VerticesPerLoop, Loops, h2, h4)
+    helixVert = VerticesPerLoop
+    topVert = helixVert + N * (VerticesPerLoop * Loops + 1)
+    lastTurn = helixVert + N * VerticesPerLoop * (Loops - 1)
+    index = np.arange(first, last)
+    verts = np.empty((len(index), 3))
+    shared = index.copy()
+
+    bottom = index < helixVert
+    verts[bottom] = circleVerts(VerticesPerLoop, r, zoffset)[index[bottom]]
+    if femaleThreads:
+        z = Loops * H + zoffset
+    else:
+        z = (Loops + 1)*H + zoffset
+    top = index >= topVert
+    verts[top] = circleVerts(VerticesPerLoop, r, z)[index[top] - topVert]
+
+    helix = ~bottom & ~top
+    if helix.any():
+        rowFirst = (index[helix][0] - helixVert) // N
+        rows = threadRows(rowFirst, (index[helix][-1] - helixVert) // N + 1, VerticesPerLoop, Loops, R, r, h1, h2, h3, h4, falloffRate, zoffset, femaleThreads)
+        verts[helix] = rows.reshape(-1, 3)[index[helix] - helixVert - N * rowFirst]
         if femaleThreads:
-            z = Loops * H + zoffset
-        else:
-            z = (Loops + 1)*H + zoffset
-       
-        verts[startVert + N * (VerticesPerLoop * Loops + 1) + i + VerticesPerLoop][0] = x
-        verts[startVert + N * (VerticesPerLoop * Loops + 1) + i + VerticesPerLoop][1] = y
-        verts[startVert + N * (VerticesPerLoop * Loops + 1) + i + VerticesPerLoop][2] = z
-
-    # Just to ensure we have the right size
-    faces[startFace + (N-1) * VerticesPerLoop * Loops + VerticesPerLoop] = [0 for _ in range(N+2)]
-   
+            # Neighbouring profile points that got flattened onto the same
+            # spot are one vertex. They are compared as the float32 they are
+            # stored as, since a point a rounding error short of the top
+            # isn't flattened but still lands on the same float32 spot.
+            rows32 = rows.astype(np.float32)
+            row, col = np.nonzero((rows32[:, 1:] == rows32[:, :-1]).all(axis=2))
+            flat = helixVert + N * (rowFirst + row) + col + 1
+            flat = flat[(flat >= first) & (flat < last)]
+            shared[flat - first] = flat - 1
+
+    # The root at the top of each turn is the root at the bottom of the next,
+    # and the bottom row starts where the helix does.
+    turn, col = np.divmod(index - helixVert, N)
+    root = helix & (col == N - 1) & (turn <= VerticesPerLoop * (Loops - 1))
+    shared[root] = index[root] + 1 + N * (VerticesPerLoop - 1)
+    shared[index == 0] = helixVert
+    # Female threads are flattened onto the top edge over the whole last turn,
+    # male threads only meet it where the helix ends.
+    if femaleThreads:
+        shared[top] = lastTurn + N * (index[top] - topVert) + N - 1
+    else:
+        shared[index == topVert] = topVert - 1
+    return verts, shared
+
+def threadFaces(first, last, VerticesPerLoop, Loops, R, r, h1, h2, h3, h4, falloffRate, zoffset, femaleThreads=False):
+    # Faces first to last of a thread, in the numbering of threadVerts, and
+    # the ones among them that are ngons. The rows of the ngons are left 0.
+    N, numVerts, numFaces = threadSize(VerticesPerLoop, Loops, h2, h4)
+    helixVert = VerticesPerLoop
+    topVert = helixVert + N * (VerticesPerLoop * Loops + 1)
+    lastTurn = helixVert + N * VerticesPerLoop * (Loops - 1)
+    topFace = (N-1) * VerticesPerLoop * Loops + VerticesPerLoop
+    face = np.arange(first, last)
+    faces = np.zeros((len(face), 4), dtype=np.int64)
+    ngons = {}
+
+    # Faces are wound to face away from the axis, as a male thread does.
+    part = face < VerticesPerLoop - 1
+    i = face[part]
+    faces[part] = np.stack((i, i + 1, helixVert + i * N + N, helixVert + i * N), axis=1)
     # This one face has N + 2 vertices, not just 4.
-    faces[startFace + (N-1) * VerticesPerLoop * Loops + VerticesPerLoop][0] = startVert + N * VerticesPerLoop * (Loops - 1) + (N - 1) + VerticesPerLoop
-    faces[startFace + (N-1) * VerticesPerLoop * Loops + VerticesPerLoop][1] = startVert + N * VerticesPerLoop * (Loops - 1) + 2*N - 1 + VerticesPerLoop
-    faces[startFace + (N-1) * VerticesPerLoop * Loops + VerticesPerLoop][2] = startVert +N * (VerticesPerLoop * Loops + 1) + 1 + VerticesPerLoop
-    for i in range(1,N):
-        faces[startFace + (N-1) * VerticesPerLoop * Loops + VerticesPerLoop][2+i] = startVert + N * (VerticesPerLoop * Loops + 1) + VerticesPerLoop - i
-
-    for i in range(1,VerticesPerLoop-1):
-        faces[startFace + (N-1) * VerticesPerLoop * Loops + i + VerticesPerLoop][0] = startVert + N * VerticesPerLoop * (Loops - 1) + (N - 1) + i*N + VerticesPerLoop
-        faces[startFace + (N-1) * VerticesPerLoop * Loops + i + VerticesPerLoop][1] = startVert + N * VerticesPerLoop * (Loops - 1) + 2*N - 1 + i*N + VerticesPerLoop
-        faces[startFace + (N-1) * VerticesPerLoop * Loops + i + VerticesPerLoop][2] = startVert + N * (VerticesPerLoop * Loops + 1) + 1 + i + VerticesPerLoop
-        faces[startFace + (N-1) * VerticesPerLoop * Loops + i + VerticesPerLoop][3] = startVert + N * (VerticesPerLoop * Loops + 1) + i + VerticesPerLoop
-
-    faces[startFace + (N-1) * VerticesPerLoop * Loops + 2 * VerticesPerLoop - 1][0] = startVert + VerticesPerLoop * (N * Loops + 1) - 1
-    faces[startFace + (N-1) * VerticesPerLoop * Loops + 2 * VerticesPerLoop - 1][1] = startVert + N * (VerticesPerLoop * Loops + 1) + 2 * VerticesPerLoop - 1
-    faces[startFace + (N-1) * VerticesPerLoop * Loops + 2 * VerticesPerLoop - 1][2] = startVert + N * (VerticesPerLoop * Loops + 1) + VerticesPerLoop
-    faces[startFace + (N-1) * VerticesPerLoop * Loops + 2 * VerticesPerLoop - 1][3] = startVert + N * (VerticesPerLoop * Loops + 1) + VerticesPerLoop - 1
-
-def createBladeBase(VerticesPerLoop, numMaleLoops, R, r, h1, h2, h3, h4, falloffRate, maleOffset, maleThickness=2, femaleThickness=3):
-    # Code
+    if first <= VerticesPerLoop - 1 < last:
+        ngons[VerticesPerLoop - 1] = [VerticesPerLoop - 1, helixVert] + [helixVert + i for i in range(1,N)] + [helixVert + (VerticesPerLoop - 1) * N]
+
+    # Here we actually create the threads.
+    part = (face >= VerticesPerLoop) & (face < topFace)
+    i, j = np.divmod(face[part] - VerticesPerLoop, N - 1)
+    faces[part] = np.stack((N * i + j, N * (i + 1) + j, N * (i + 1) + 1 + j, N * i + 1 + j), axis=1) + helixVert
+
+    # This one face has N + 2 vertices, not just 4. Like the bottom one it
+    # starts from a corner off its long straight edge, so it fans cleanly.
+    if first <= topFace < last:
+        ngons[topFace] = [lastTurn + 2*N - 1, topVert + 1] + [topVert - i for i in range(1,N)] + [lastTurn + N - 1]
+    part = face > topFace
+    i = face[part] - topFace
+    faces[part] = np.stack((lastTurn + (N - 1) + i*N, lastTurn + 2*N - 1 + i*N, topVert + (i + 1) % VerticesPerLoop, topVert + i), axis=1)
+
+    # A female thread is the wall of a hole, so it faces the other way.
+    if femaleThreads:
+        faces = faces[:, ::-1]
+        for ngon in ngons.values():
+            ngon.reverse()
+    return faces, {face - first: ngon for face, ngon in ngons.items()}
+
+def createThreads(VerticesPerLoop, mesh, startVert, startFace, Loops, R, r, h1, h2, h3, h4, falloffRate, zoffset, femaleThreads = False):
+    # A whole thread at startVert and startFace of mesh. Inside threadWorkers
+    # a large thread on a mesh in threadBuffers is split between the workers,
+    # each writing its share straight into the mesh.
+    thread = (VerticesPerLoop, Loops, R, r, h1, h2, h3, h4, falloffRate, zoffset, femaleThreads)
+    N, numVerts, numFaces = threadSize(VerticesPerLoop, Loops, h2, h4)
+    if threadPool is not None and getattr(mesh, 'memory', None) and numFaces >= PARALLEL_FACES:
+        pool, workers = threadPool
+        vertSplit = np.linspace(0, numVerts, workers + 1).astype(int)
+        faceSplit = np.linspace(0, numFaces, workers + 1).astype(int)
+        jobs = [(mesh.memory, startVert, startFace, thread, vertSplit[i:i + 2], faceSplit[i:i + 2]) for i in range(workers)]
+        for ngons in pool.map(getattr(workerModule(), 'fillThread'), *zip(*jobs)):
+            mesh.ngons.update(ngons)
+        return
+    verts, shared = threadVerts(0, numVerts, *thread)
+    mesh.verts[startVert:startVert + numVerts] = verts
+    mesh.shared[startVert:startVert + numVerts] = startVert + shared
+    faces, ngons = threadFaces(0, numFaces, *thread)
+    faces += startVert
+    faces[list(ngons)] = 0
+    mesh.faces[startFace:startFace + numFaces] = faces
+    for face, ngon in ngons.items():
+        mesh.ngons[startFace + face] = [startVert + v for v in ngon]
+
+def fillThread(memory, startVert, startFace, thread, verts, faces):
+    # The part of createThreads a worker does: vertices verts[0] to verts[1]
+    # and faces faces[0] to faces[1] of a thread, written into a MeshBuffer
+    # in shared memory. Returns the ngons among the faces.
+    blocks = [shared_memory.SharedMemory(name) for name, shape, dtype in memory]
+    try:
+        meshVerts, meshShared, meshFaces = [np.ndarray(shape, dtype, block.buf) for block, (name, shape, dtype) in zip(blocks, memory)]
+        coords, shared = threadVerts(verts[0], verts[1], *thread)
+        meshVerts[startVert + verts[0]:startVert + verts[1]] = coords
+        meshShared[startVert + verts[0]:startVert + verts[1]] = startVert + shared
+        rows, ngons = threadFaces(faces[0], faces[1], *thread)
+        rows += startVert
+        rows[list(ngons)] = 0
+        meshFaces[startFace + faces[0]:startFace + faces[1]] = rows
+        del meshVerts, meshShared, meshFaces
+    finally:
+        for block in blocks:
+            block.close()
+    return {startFace + faces[0] + face: [startVert + v for v in ngon] for face, ngon in ngons.items()}
+
+# Smallest thread, in faces, createThreads splits between threadWorkers; below
+# it handing out the work costs more than it saves.
+PARALLEL_FACES = 1 << 16
+
+# (pool, processes) of the workers inside threadWorkers.
+threadPool = None
+
+# The same, kept between threadWorkers, since starting the workers takes
+# longer than making all but the largest parts.
+keptPool = None
+
+@contextmanager
+def threadWorkers(processes=None):
+    # Within this, large threads are made by processes worker processes at
+    # once, for when a single part is being made and the other cores are
+    # idle. Only asking for 2 or more processes turns it on, and it does
+    # nothing without shared memory or when workerModule can't be loaded.
+    # The workers are started the first time and used again after.
+    global threadPool, keptPool
+    if threadPool is not None or not processes or processes < 2 or shared_memory is None or workerModule() is None:
+        yield
+        return
+    if keptPool is None or keptPool[1] != processes:
+        if keptPool is not None:
+            keptPool[0].shutdown()
+        keptPool = ProcessPoolExecutor(processes, mp_context=workerContext()), processes
+    threadPool = keptPool
+    try:
+        with workerMain():
+            yield
+    finally:
+        threadPool = None
+
+@contextmanager
+def threadBuffers(mesh):
+    # Within this, inside threadWorkers, the vertices, shared and faces of
+    # mesh live in shared memory, where the workers of createThreads can
+    # write to them. Whatever is still there at the end is copied out.
+    if threadPool is None:
+        yield
+        return
+    arrays = [mesh.verts, mesh.shared, mesh.faces]
+    # Only what was made before anything went wrong is cleaned up.
+    blocks = []
+    views = []
+    try:
+        for array in arrays:
+            blocks.append(shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1)))
+            views.append(np.ndarray(array.shape, array.dtype, blocks[-1].buf))
+            views[-1][...] = array
+        mesh.verts, mesh.shared, mesh.faces = views
+        mesh.memory = [(block.name, array.shape, array.dtype.str) for block, array in zip(blocks, arrays)]
+        del arrays
+        yield
+    finally:
+        if hasattr(mesh, 'memory'):
+            del mesh.memory
+        for name, view in zip(('verts', 'shared', 'faces'), views):
+            if getattr(mesh, name) is view:
+                setattr(mesh, name, view.copy())
+        view = None
+        del views[:]
+        for block in blocks:
+            block.close()
+            block.unlink()
+
+def stitchFaces(startVert, startCount, joinVert, joinCount):
+    # Band between two rings. Rings with different numbers of vertices are
+    # zipped together by angle: walking around both at once, every step onto
+    # the next vertex of either ring makes one triangle.
+    if startCount == joinCount:
+        return circleFaces(startCount, startVert, joinVert)
+    steps = np.concatenate((np.arange(1, startCount + 1) / startCount, np.arange(1, joinCount + 1) / joinCount))
+    onStart = (np.arange(len(steps)) < startCount)[np.argsort(steps, kind='stable')]
+    a = np.cumsum(onStart) - onStart
+    b = np.cumsum(~onStart) - ~onStart
+    faces = np.full((len(steps), 4), -1)
+    faces[:, 0] = startVert + a % startCount
+    faces[:, 1] = np.where(onStart, startVert + (a + 1) % startCount, joinVert + (b + 1) % joinCount)
+    faces[:, 2] = joinVert + b % joinCount
+    return faces
+
+def segments(VerticesPerLoop, radius, chordError):
+    # Fewest vertices around a circle of this radius that keep every edge
+    # within chordError of the true circle, but never more than
+    # VerticesPerLoop. Without a chordError every circle gets VerticesPerLoop.
+    # A circle of no radius is a point, which any number of vertices makes.
+    if chordError is None:
+        return VerticesPerLoop
+    if radius <= 0:
+        return min(VerticesPerLoop, 12)
+    return min(VerticesPerLoop, max(12, ceil(pi / acos(max(-1, 1 - chordError / radius)))))
+
+class OutlinePlan:
+    # Where every thread, ring and band of a part goes in its MeshBuffer,
+    # worked out before anything is made, so compileOutline can make the
+    # part all at once and streamOutline a few faces at a time.
+    def __init__(self, VerticesPerLoop, h1, h2, h3, h4, outline, chordError=None, envelopes=False):
+        H = h1 + h2 + h3 + h4
+        N = 3
+        if h2 > 0:
+            N = N + 1
+        if h4 > 0:
+            N = N + 1
+
+        # For a quick look, envelopes swaps every thread for the plain cylinder
+        # it fills: out to the crests of a male thread, in to those of a female.
+        if envelopes:
+            cylinders = []
+            for entry in outline:
+                if entry[0] == 'thread':
+                    _, Loops, R, r, falloffRate, zoffset, femaleThreads = entry
+                    if femaleThreads:
+                        entry = [('ring', r, Loops * H + zoffset), ('ring', r, zoffset)]
+                    else:
+                        entry = [('ring', r, zoffset), ('ring', R, zoffset), ('ring', R, (Loops + 1) * H + zoffset), ('ring', r, (Loops + 1) * H + zoffset)]
+                    cylinders += entry
+                else:
+                    cylinders.append(entry)
+            outline = cylinders
+
+        # Threads come first, then all the rings, then all the bands.
+        counts = [segments(VerticesPerLoop, entry[1] if entry[0] == 'ring' else entry[2], chordError) for entry in outline]
+        threads = [(entry, count) for entry, count in zip(outline, counts) if entry[0] == 'thread']
+        ringVert = sum(N * (count * entry[1] + 1) + 2 * count for entry, count in threads)
+        bandFace = sum((N - 1) * count * entry[1] + 2 * count for entry, count in threads)
+        bands = [count if count == nextCount else count + nextCount for count, nextCount in zip(counts, counts[1:] + counts[:1])]
+        self.numVerts = ringVert + sum(count for entry, count in zip(outline, counts) if entry[0] == 'ring')
+        self.numFaces = bandFace + sum(bands)
+
+        # Where the outline enters and leaves each entry: the first vertex of
+        # the ring there, its number of vertices and its (radius, z).
+        # threads holds the first vertex, first face and createThreads
+        # arguments of every thread, rings the place of every ring as above.
+        enter = []
+        leave = []
+        self.threads = []
+        self.rings = []
+        self.sections = []
+        startVert = 0
+        startFace = 0
+        for entry, count in zip(outline, counts):
+            if entry[0] == 'ring':
+                ring = (ringVert, count, entry[1], entry[2])
+                ringVert += count
+                enter.append(ring)
+                leave.append(ring)
+                self.rings.append(ring)
+                continue
+            _, Loops, R, r, falloffRate, zoffset, femaleThreads = entry
+            self.threads.append((startVert, startFace, (count, Loops, R, r, h1, h2, h3, h4, falloffRate, zoffset, femaleThreads)))
+            bottom = (startVert, count, r, zoffset)
+            startVert += N * (count * Loops + 1) + 2 * count
+            # Male threads are climbed on the outside, female threads
+            # descended on the inside.
+            if femaleThreads:
+                top = (startVert - count, count, r, Loops * H + zoffset)
+                enter.append(top)
+                leave.append(bottom)
+            else:
+                top = (startVert - count, count, r, (Loops + 1) * H + zoffset)
+                enter.append(bottom)
+                leave.append(top)
+            self.sections.append((startFace, '%s thread at z %.2f-%.2f' % ('female' if femaleThreads else 'male', zoffset, top[3])))
+            startFace += (N - 1) * count * Loops + 2 * count
+
+        # Shoelace formula over the outline; anything but a positive area
+        # would turn the part inside out.
+        path = np.array([point[2:] for pair in zip(enter, leave) for point in pair])
+        area = np.sum(path[:, 0] * np.roll(path[:, 1], -1) - np.roll(path[:, 0], -1) * path[:, 1]) / 2
+        if area <= 0:
+            raise ValueError('part outline must run counter-clockwise in the (radius, z) plane')
+
+        # The first face of every band and the rings it runs between.
+        self.bands = []
+        for start, join in zip(leave, enter[1:] + enter[:1]):
+            self.bands.append((bandFace, start, join))
+            self.sections.append((bandFace, 'band from (r %.2f, z %.2f) to (r %.2f, z %.2f)' % (start[2], start[3], join[2], join[3])))
+            bandFace += len(stitchFaces(start[0], start[1], join[0], join[1]))
+
+    def verts(self, ids):
+        # Coordinates of the given vertices, a sorted array, and the vertex
+        # each of them really is.
+        coords = np.empty((len(ids), 3))
+        shared = ids.copy()
+        for startVert, startFace, thread in self.threads:
+            inside = np.flatnonzero((ids >= startVert) & (ids < startVert + threadSize(thread[0], thread[1], thread[5], thread[7])[1]))
+            if len(inside):
+                first = ids[inside[0]] - startVert
+                verts, targets = threadVerts(first, ids[inside[-1]] - startVert + 1, *thread)
+                coords[inside] = verts[ids[inside] - startVert - first]
+                shared[inside] = targets[ids[inside] - startVert - first] + startVert
+        for startVert, count, radius, z in self.rings:
+            inside = np.flatnonzero((ids >= startVert) & (ids < startVert + count))
+            if len(inside):
+                coords[inside] = circleVerts(count, radius, z)[ids[inside] - startVert]
+        return coords, shared
+
+    def chunk(self, faces, ngons):
+        # A MeshBuffer of just the given faces, numbered as in the whole part,
+        # and the vertices they use, with its shared vertices resolved the
+        # same way the whole part's are.
+        rows = np.ones(len(faces), dtype=bool)
+        rows[list(ngons)] = False
+        ids = np.unique(np.concatenate([faces[rows].ravel()] + [np.asarray(ngon) for ngon in ngons.values()]))
+        ids = ids[ids >= 0]
+        while True:
+            coords, shared = self.verts(ids)
+            missing = np.setdiff1d(shared, ids)
+            if not len(missing):
+                break
+            ids = np.union1d(ids, missing)
+        mesh = MeshBuffer(len(ids), len(faces))
+        mesh.verts[:] = coords
+        mesh.shared = np.searchsorted(ids, shared)
+        mesh.faces[:] = np.where(faces < 0, -1, np.searchsorted(ids, faces))
+        mesh.ngons = {face: np.searchsorted(ids, ngon).tolist() for face, ngon in ngons.items()}
+        mesh.resolveShared()
+        return mesh
+
+def compileOutline(VerticesPerLoop, h1, h2, h3, h4, outline, chordError=None, envelopes=False):
+    # A part is its outline revolved around the z axis. The outline is a list
+    # of ('ring', radius, z) and
+    # ('thread', Loops, R, r, falloffRate, zoffset, femaleThreads) entries,
+    # all sharing the h1..h4 thread profile. It runs counter-clockwise in the
+    # (radius, z) plane, up the outside of the part and down the inside, and
+    # every entry is joined to the next by a band of faces, the last one back
+    # to the first. With a chordError every entry gets only as many vertices
+    # around as its radius needs.
+    plan = OutlinePlan(VerticesPerLoop, h1, h2, h3, h4, outline, chordError, envelopes)
+    mesh = MeshBuffer(plan.numVerts, plan.numFaces)
+    mesh.sections = list(plan.sections)
+    big = any(threadSize(thread[0], thread[1], thread[5], thread[7])[2] >= PARALLEL_FACES for startVert, startFace, thread in plan.threads)
+    with threadBuffers(mesh) if big else nullcontext():
+        for startVert, startFace, thread in plan.threads:
+            with stage('createThreads') as record:
+                createThreads(thread[0], mesh, startVert, startFace, *thread[1:])
+                N, record['verts'], record['faces'] = threadSize(thread[0], thread[1], thread[5], thread[7])
+        with stage('rings') as record:
+            for startVert, count, radius, z in plan.rings:
+                mesh.verts[startVert:startVert + count] = circleVerts(count, radius, z)
+            record['verts'] = sum(ring[1] for ring in plan.rings)
+        with stage('bands') as record:
+            record['faces'] = len(mesh.faces) - (plan.bands[0][0] if plan.bands else len(mesh.faces))
+            for bandFace, start, join in plan.bands:
+                band = stitchFaces(start[0], start[1], join[0], join[1])
+                mesh.faces[bandFace:bandFace + len(band)] = band
+        with stage('resolveShared') as record:
+            before = len(mesh.verts)
+            mesh.resolveShared()
+            record['verts'] = len(mesh.verts)
+            record['faces'] = len(mesh.faces)
+            record['welded'] = before - len(mesh.verts)
+    return mesh
+
+def streamOutline(VerticesPerLoop, h1, h2, h3, h4, outline, chordError=None, envelopes=False, chunkFaces=1 << 16):
+    # The part compileOutline makes, as a series of MeshBuffers of at most
+    # chunkFaces faces each. Their triangles one after another are exactly
+    # those of the whole part, in the same order, but only one chunk and the
+    # vertices it needs are held at a time, so even a part too big to fit in
+    # memory can be written out.
+    plan = OutlinePlan(VerticesPerLoop, h1, h2, h3, h4, outline, chordError, envelopes)
+    for startVert, startFace, thread in plan.threads:
+        numFaces = threadSize(thread[0], thread[1], thread[5], thread[7])[2]
+        for first in range(0, numFaces, chunkFaces):
+            faces, ngons = threadFaces(first, min(first + chunkFaces, numFaces), *thread)
+            yield plan.chunk(faces + startVert, {face: [startVert + v for v in ngon] for face, ngon in ngons.items()})
+    for bandFace, start, join in plan.bands:
+        band = stitchFaces(start[0], start[1], join[0], join[1])
+        for first in range(0, len(band), chunkFaces):
+            yield plan.chunk(band[first:first + chunkFaces], {})
+
+def bladeBaseOutline(numMaleLoops, R, r, h1, h2, h3, h4, falloffRate, maleOffset, maleThickness=2, femaleThickness=3):
     H = h1 + h2 + h3 + h4
-    N = 3
-    if h2 > 0:
-        N = N + 1
-    if h4 > 0:
-        N = N + 1
-
-    verts = [[0, 0, 0] for _ in range(N * (VerticesPerLoop * numMaleLoops + 1) + 9*VerticesPerLoop)]
-    faces = [[0, 0, 0, 0] for _ in range(( N - 1) * VerticesPerLoop * numMaleLoops + 10*VerticesPerLoop) ]
-   
-    startVert = 0
-    startFace = 0
-    femaleThreads = False
-    createThreads(VerticesPerLoop, verts, faces, startVert, startFace, numMaleLoops, R, r, h1, h2, h3, h4, falloffRate, maleOffset, femaleThreads)
-   
-    radius = r - maleThickness - .5
-    startVert = N * (VerticesPerLoop * numMaleLoops + 1) + 2 * VerticesPerLoop
-    startFace = (N-1) * VerticesPerLoop * numMaleLoops + 2 * VerticesPerLoop
-    joinVert = 0
-    joinFace = 0
-    zHeight = maleOffset
-    createCircularPolys(VerticesPerLoop, verts, faces, radius, zHeight, startVert, startFace, joinVert, joinFace)
-   
-    radius = r - maleThickness - .5
-    startVert = N * (VerticesPerLoop * numMaleLoops + 1) + 3 * VerticesPerLoop
-    startFace = (N-1) * VerticesPerLoop * numMaleLoops + 3 * VerticesPerLoop
-    joinVert = N * (VerticesPerLoop * numMaleLoops + 1) + 2 * VerticesPerLoop
-    joinFace = 0
-    zHeight = (numMaleLoops + 1)* H + maleOffset
-    createCircularPolys(VerticesPerLoop, verts, faces, radius, zHeight, startVert, startFace, joinVert, joinFace)
-    
-    radius = r - maleThickness - 0.5
-    startVert = N * (VerticesPerLoop * numMaleLoops + 1) + 4 * VerticesPerLoop
-    startFace = (N-1) * VerticesPerLoop * numMaleLoops + 4 * VerticesPerLoop
-    joinVert = N * (VerticesPerLoop * numMaleLoops + 1) + 3 * VerticesPerLoop
-    zHeight = (numMaleLoops + 1)* H + maleOffset + 11.5
-    createCircularPolys(VerticesPerLoop, verts, faces, radius, zHeight, startVert, startFace, joinVert, joinFace)
-    
-    radius = 12.8
-    startVert = N * (VerticesPerLoop * numMaleLoops + 1) + 5 * VerticesPerLoop
-    startFace = (N-1) * VerticesPerLoop * numMaleLoops + 5 * VerticesPerLoop
-    joinVert = N * (VerticesPerLoop * numMaleLoops + 1) + 4 * VerticesPerLoop
-    zHeight = (numMaleLoops + 1)* H + maleOffset + 11.5
-    createCircularPolys(VerticesPerLoop, verts, faces, radius, zHeight, startVert, startFace, joinVert, joinFace)
-    
-    radius = 12.8
-    startVert = N * (VerticesPerLoop * numMaleLoops + 1) + 6 * VerticesPerLoop
-    startFace = (N-1) * VerticesPerLoop * numMaleLoops + 6 * VerticesPerLoop
-    joinVert = N * (VerticesPerLoop * numMaleLoops + 1) + 5 * VerticesPerLoop
-    zHeight = (numMaleLoops + 1)* H + maleOffset + 15.5
-    createCircularPolys(VerticesPerLoop, verts, faces, radius, zHeight, startVert, startFace, joinVert, joinFace)
-    
-    radius = R + femaleThickness
-    startVert = N * (VerticesPerLoop * numMaleLoops + 1) + 7 * VerticesPerLoop
-    startFace = (N-1) * VerticesPerLoop * numMaleLoops + 7 * VerticesPerLoop
-    joinVert = N * (VerticesPerLoop * numMaleLoops + 1) + 1 * VerticesPerLoop
-    zHeight = (numMaleLoops + 1)* H + maleOffset
-    createCircularPolys(VerticesPerLoop, verts, faces, radius, zHeight, startVert, startFace, joinVert, joinFace)
-    
-    radius = R + femaleThickness
-    startVert = N * (VerticesPerLoop * numMaleLoops + 1) + 8 * VerticesPerLoop
-    startFace = (N-1) * VerticesPerLoop * numMaleLoops + 8 * VerticesPerLoop
-    joinVert = N * (VerticesPerLoop * numMaleLoops + 1) + 7 * VerticesPerLoop
-    zHeight = (numMaleLoops + 1)* H + maleOffset + 15.5
-    createCircularPolys(VerticesPerLoop, verts, faces, radius, zHeight, startVert, startFace, joinVert, joinFace)
-    
-    startVert = N * (VerticesPerLoop * numMaleLoops + 1) + 8 * VerticesPerLoop
-    startFace = (N-1) * VerticesPerLoop * numMaleLoops + 9 * VerticesPerLoop
-    joinVert = N * (VerticesPerLoop * numMaleLoops + 1) + 6 * VerticesPerLoop
-    joinCircularPolys(VerticesPerLoop, verts, faces, startVert, startFace, joinVert)
-    
-    return verts, faces
-
-def createCPFemaleBase(VerticesPerLoop, numTopLoops, numBottomLoops, RTop, rTop, RBottom, rBottom, h1, h2, h3, h4, falloffRate, topOffset, bottomOffset, thickness = 3):
-    # Code
+    top = (numMaleLoops + 1) * H + maleOffset
+    bore = r - maleThickness - .5
+    return h1, h2, h3, h4, [
+        ('thread', numMaleLoops, R, r, falloffRate, maleOffset, False),
+        ('ring', R + femaleThickness, top),
+        ('ring', R + femaleThickness, top + 15.5),
+        # Socket for the blade tube
+        ('ring', 12.8, top + 15.5),
+        ('ring', 12.8, top + 11.5),
+        ('ring', bore, top + 11.5),
+        ('ring', bore, top),
+        ('ring', bore, maleOffset),
+    ]
+
+def createBladeBase(VerticesPerLoop, numMaleLoops, R, r, h1, h2, h3, h4, falloffRate, maleOffset, maleThickness=2, femaleThickness=3, chordError=None, envelopes=False):
+    return compileOutline(VerticesPerLoop, *bladeBaseOutline(numMaleLoops, R, r, h1, h2, h3, h4, falloffRate, maleOffset, maleThickness, femaleThickness), chordError, envelopes)
+
+def cpFemaleBaseOutline(numTopLoops, numBottomLoops, RTop, rTop, RBottom, rBottom, h1, h2, h3, h4, falloffRate, topOffset, bottomOffset, thickness = 3):
     H = h1 + h2 + h3 + h4
-    N = 3
-    if h2 > 0:
-        N = N + 1
-    if h4 > 0:
-        N = N + 1
-
-    verts = [[0, 0, 0] for _ in range(N * (VerticesPerLoop * numTopLoops + 1) + N * (VerticesPerLoop * numBottomLoops + 1) + 15*VerticesPerLoop)]
-    faces = [[0, 0, 0, 0] for _ in range(( N - 1) * VerticesPerLoop * numTopLoops + ( N - 1) * VerticesPerLoop * numBottomLoops  + 17*VerticesPerLoop) ]
-   
-    startVert = 0
-    startFace = 0
-    createThreads(VerticesPerLoop, verts, faces, startVert, startFace, numTopLoops, RTop, rTop, h1, h2, h3, h4, falloffRate, topOffset, True)
-   
-    radius = rTop
-    startVert = N * (VerticesPerLoop * numTopLoops + 1) + 2 * VerticesPerLoop
-    startFace = (N-1) * VerticesPerLoop * numTopLoops + 2 * VerticesPerLoop
-    joinVert = N * (VerticesPerLoop * numTopLoops + 1) + 1 * VerticesPerLoop
-    joinFace = 0
-    zHeight = (numTopLoops) * H + topOffset + 0.2
-    createCircularPolys(VerticesPerLoop, verts, faces, radius, zHeight, startVert, startFace, joinVert, joinFace)
-    
-    radius = RTop + thickness
-    startVert = N * (VerticesPerLoop * numTopLoops + 1) + 3 * VerticesPerLoop
-    startFace = (N-1) * VerticesPerLoop * numTopLoops + 3 * VerticesPerLoop
-    joinVert = N * (VerticesPerLoop * numTopLoops + 1) + 2 * VerticesPerLoop
-    joinFace = 0
-    zHeight = (numTopLoops) * H + topOffset + 0.2
-    createCircularPolys(VerticesPerLoop, verts, faces, radius, zHeight, startVert, startFace, joinVert, joinFace)
-    
-    radius = RTop + thickness
-    startVert = N * (VerticesPerLoop * numTopLoops + 1) + 4 * VerticesPerLoop
-    startFace = (N-1) * VerticesPerLoop * numTopLoops + 4 * VerticesPerLoop
-    joinVert = N * (VerticesPerLoop * numTopLoops + 1) + 3 * VerticesPerLoop
-    joinFace = 0
-    zHeight = topOffset
-    createCircularPolys(VerticesPerLoop, verts, faces, radius, zHeight, startVert, startFace, joinVert, joinFace)
-    
-    startVert = N * (VerticesPerLoop * numTopLoops + 1) + 5 * VerticesPerLoop
-    startFace = (N-1) * VerticesPerLoop * numTopLoops + 5 * VerticesPerLoop
-    createThreads(VerticesPerLoop, verts, faces, startVert, startFace, numBottomLoops, RBottom, rBottom, h1, h2, h3, h4, falloffRate, bottomOffset, True)
-    
-    radius = rBottom
-    startVert = N * (VerticesPerLoop * numTopLoops + 1) + N * (VerticesPerLoop * numBottomLoops + 1) + 7 * VerticesPerLoop
-    startFace = (N-1) * VerticesPerLoop * numTopLoops + (N-1) * VerticesPerLoop * numBottomLoops + 7 * VerticesPerLoop
-    joinVert = N * (VerticesPerLoop * numTopLoops + 1) + 5 * VerticesPerLoop
-    joinFace = 0
-    zHeight = bottomOffset - 0.2
-    createCircularPolys(VerticesPerLoop, verts, faces, radius, zHeight, startVert, startFace, joinVert, joinFace)
-    
-    radius = RBottom + thickness
-    startVert = N * (VerticesPerLoop * numTopLoops + 1) + N * (VerticesPerLoop * numBottomLoops + 1) + 8 * VerticesPerLoop
-    startFace = (N-1) * VerticesPerLoop * numTopLoops + (N-1) * VerticesPerLoop * numBottomLoops + 8 * VerticesPerLoop
-    joinVert = N * (VerticesPerLoop * numTopLoops + 1) + N * (VerticesPerLoop * numBottomLoops + 1) + 7 * VerticesPerLoop
-    joinFace = 0
-    zHeight = bottomOffset - 0.2
-    createCircularPolys(VerticesPerLoop, verts, faces, radius, zHeight, startVert, startFace, joinVert, joinFace)
-    
-    radius = RBottom + thickness
-    startVert = N * (VerticesPerLoop * numTopLoops + 1) + N * (VerticesPerLoop * numBottomLoops + 1) + 9 * VerticesPerLoop
-    startFace = (N-1) * VerticesPerLoop * numTopLoops + (N-1) * VerticesPerLoop * numBottomLoops + 9 * VerticesPerLoop
-    joinVert = N * (VerticesPerLoop * numTopLoops + 1) + N * (VerticesPerLoop * numBottomLoops + 1) + 8 * VerticesPerLoop
-    joinFace = 0
-    zHeight = numBottomLoops * H + bottomOffset
-    createCircularPolys(VerticesPerLoop, verts, faces, radius, zHeight, startVert, startFace, joinVert, joinFace)
-    
-    radius = RBottom + thickness
-    startVert = N * (VerticesPerLoop * numTopLoops + 1) + N * (VerticesPerLoop * numBottomLoops + 1) + 10 * VerticesPerLoop
-    startFace = (N-1) * VerticesPerLoop * numTopLoops + (N-1) * VerticesPerLoop * numBottomLoops + 10 * VerticesPerLoop
-    joinVert = N * (VerticesPerLoop * numTopLoops + 1) + N * (VerticesPerLoop * numBottomLoops + 1) + 9 * VerticesPerLoop
-    joinFace = 0
-    zHeight = bottomOffset + (numBottomLoops + 1) * H
-    createCircularPolys(VerticesPerLoop, verts, faces, radius, zHeight, startVert, startFace, joinVert, joinFace)
-    
-    
-    radius = rBottom
-    startVert = N * (VerticesPerLoop * numTopLoops + 1) + N * (VerticesPerLoop * numBottomLoops + 1) + 11 * VerticesPerLoop
-    startFace = (N-1) * VerticesPerLoop * numTopLoops + (N-1) * VerticesPerLoop * numBottomLoops + 11 * VerticesPerLoop
-    joinVert = N * (VerticesPerLoop * numTopLoops + 1) + N * (VerticesPerLoop * numBottomLoops + 1) + 6 * VerticesPerLoop
-    joinFace = 0
-    zHeight = bottomOffset + (numBottomLoops + 1) * H
-    createCircularPolys(VerticesPerLoop, verts, faces, radius, zHeight, startVert, startFace, joinVert, joinFace)
-    
-    radius = rBottom
-    startVert = N * (VerticesPerLoop * numTopLoops + 1) + N * (VerticesPerLoop * numBottomLoops + 1) + 12 * VerticesPerLoop
-    startFace = (N-1) * VerticesPerLoop * numTopLoops + (N-1) * VerticesPerLoop * numBottomLoops + 12 * VerticesPerLoop
-    joinVert = N * (VerticesPerLoop * numTopLoops + 1) + + N * (VerticesPerLoop * numBottomLoops + 1) + 11 * VerticesPerLoop
-    joinFace = 0
-    zHeight = (topOffset - (bottomOffset + (numBottomLoops + 1) * H))/2 + (bottomOffset + (numBottomLoops + 1) * H)
-    createCircularPolys(VerticesPerLoop, verts, faces, radius, zHeight, startVert, startFace, joinVert, joinFace)
-    
-    radius = RBottom + thickness
-    startVert = N * (VerticesPerLoop * numTopLoops + 1) + N * (VerticesPerLoop * numBottomLoops + 1) + 13 * VerticesPerLoop
-    startFace = (N-1) * VerticesPerLoop * numTopLoops + (N-1) * VerticesPerLoop * numBottomLoops + 13 * VerticesPerLoop
-    joinVert = N * (VerticesPerLoop * numTopLoops + 1) + N * (VerticesPerLoop * numBottomLoops + 1) + 10 * VerticesPerLoop
-    joinFace = 0
-    zHeight = 2 * (topOffset - (bottomOffset + (numBottomLoops + 1) * H))/3 + (bottomOffset + (numBottomLoops + 1) * H)
-    createCircularPolys(VerticesPerLoop, verts, faces, radius, zHeight, startVert, startFace, joinVert, joinFace)
-    
-    
-    radius = rTop - 2
-    startVert = N * (VerticesPerLoop * numTopLoops + 1) + N * (VerticesPerLoop * numBottomLoops + 1) + 14 * VerticesPerLoop
-    startFace = (N-1) * VerticesPerLoop * numTopLoops + (N-1) * VerticesPerLoop * numBottomLoops + 14 * VerticesPerLoop
-    joinVert = 0
-    joinFace = 0
-    zHeight = topOffset
-    createCircularPolys(VerticesPerLoop, verts, faces, radius, zHeight, startVert, startFace, joinVert, joinFace)
-    '''
-    radius = RTop + thickness
-    startVert = N * (VerticesPerLoop * numTopLoops + 1) + N * (VerticesPerLoop * numBottomLoops + 1) + 13 * VerticesPerLoop
-    startFace = (N-1) * VerticesPerLoop * numTopLoops + (N-1) * VerticesPerLoop * numBottomLoops + 13 * VerticesPerLoop
-    joinVert = N * (VerticesPerLoop * numTopLoops + 1) + 3 * VerticesPerLoop
-    joinFace = 0
-    zHeight = 2*(topOffset - bottomOffset)/3 + bottomOffset
-    createCircularPolys(VerticesPerLoop, verts, faces, radius, zHeight, startVert, startFace, joinVert, joinFace)
-    
-    radius = rBottom
-    startVert = N * (VerticesPerLoop * numTopLoops + 1) + N * (VerticesPerLoop * numBottomLoops + 1) + 14 * VerticesPerLoop
-    startFace = (N-1) * VerticesPerLoop * numTopLoops + (N-1) * VerticesPerLoop * numBottomLoops + 14 * VerticesPerLoop
-    joinVert = N * (VerticesPerLoop * numTopLoops + 1) + N * (VerticesPerLoop * numBottomLoops + 1) + 10 * VerticesPerLoop
-    joinFace = 0
-    zHeight = (topOffset - bottomOffset)/2 + bottomOffset
-    createCircularPolys(VerticesPerLoop, verts, faces, radius, zHeight, startVert, startFace, joinVert, joinFace)
-    '''
-    
-    startVert = N * (VerticesPerLoop * numTopLoops + 1) + N * (VerticesPerLoop * numBottomLoops + 1) + 14 * VerticesPerLoop
-    startFace = (N-1) * VerticesPerLoop * numTopLoops + (N-1) * VerticesPerLoop * numBottomLoops + 15 * VerticesPerLoop
-    joinVert = N * (VerticesPerLoop * numTopLoops + 1) + N * (VerticesPerLoop * numBottomLoops + 1) + 12 * VerticesPerLoop
-    joinCircularPolys(VerticesPerLoop, verts, faces, startVert, startFace, joinVert)
-    
-    startVert = N * (VerticesPerLoop * numTopLoops + 1) + N * (VerticesPerLoop * numBottomLoops + 1) + 13 * VerticesPerLoop
-    startFace = (N-1) * VerticesPerLoop * numTopLoops + (N-1) * VerticesPerLoop * numBottomLoops + 16 * VerticesPerLoop
-    joinVert = N * (VerticesPerLoop * numTopLoops + 1) + 4 * VerticesPerLoop
-    joinCircularPolys(VerticesPerLoop, verts, faces, startVert, startFace, joinVert)
-    
-    return verts, faces
-
-def createCPMaleBase(VerticesPerLoop, numTopLoops, numBottomLoops, RTop, rTop, RBottom, rBottom, h1, h2, h3, h4, falloffRate, topOffset, bottomOffset, thickness=3):
-    # Code
+    bottomTop = bottomOffset + (numBottomLoops + 1) * H
+    return h1, h2, h3, h4, [
+        ('thread', numTopLoops, RTop, rTop, falloffRate, topOffset, True),
+        ('ring', rTop - 2, topOffset),
+        ('ring', rBottom, (topOffset - bottomTop)/2 + bottomTop),
+        ('ring', rBottom, bottomTop),
+        ('thread', numBottomLoops, RBottom, rBottom, falloffRate, bottomOffset, True),
+        ('ring', rBottom, bottomOffset - 0.2),
+        ('ring', RBottom + thickness, bottomOffset - 0.2),
+        ('ring', RBottom + thickness, numBottomLoops * H + bottomOffset),
+        ('ring', RBottom + thickness, bottomTop),
+        ('ring', RBottom + thickness, 2 * (topOffset - bottomTop)/3 + bottomTop),
+        ('ring', RTop + thickness, topOffset),
+        ('ring', RTop + thickness, numTopLoops * H + topOffset + 0.2),
+        ('ring', rTop, numTopLoops * H + topOffset + 0.2),
+    ]
+
+def createCPFemaleBase(VerticesPerLoop, numTopLoops, numBottomLoops, RTop, rTop, RBottom, rBottom, h1, h2, h3, h4, falloffRate, topOffset, bottomOffset, thickness = 3, chordError = None, envelopes = False):
+    return compileOutline(VerticesPerLoop, *cpFemaleBaseOutline(numTopLoops, numBottomLoops, RTop, rTop, RBottom, rBottom, h1, h2, h3, h4, falloffRate, topOffset, bottomOffset, thickness), chordError, envelopes)
+
+def cpMaleBaseOutline(numTopLoops, numBottomLoops, RTop, rTop, RBottom, rBottom, h1, h2, h3, h4, falloffRate, topOffset, bottomOffset, thickness=3):
     H = h1 + h2 + h3 + h4
-    N = 3
-    if h2 > 0:
-        N = N + 1
-    if h4 > 0:
-        N = N + 1
-
-    verts = [[0, 0, 0] for _ in range(N * (VerticesPerLoop * numTopLoops + 1) + N * (VerticesPerLoop * numBottomLoops + 1) + 13*VerticesPerLoop)]
-    faces = [[0, 0, 0, 0] for _ in range(( N - 1) * VerticesPerLoop * numTopLoops + ( N - 1) * VerticesPerLoop * numBottomLoops  + 15*VerticesPerLoop) ]
-   
-    startVert = 0
-    startFace = 0
-    createThreads(VerticesPerLoop, verts, faces, startVert, startFace, numTopLoops, RTop, rTop, h1, h2, h3, h4, falloffRate, topOffset, False)
-    
-    radius = rTop - thickness
-    startVert = N * (VerticesPerLoop * numTopLoops + 1) + 2 * VerticesPerLoop
-    startFace = (N-1) * VerticesPerLoop * numTopLoops + 2 * VerticesPerLoop
-    joinVert = N * (VerticesPerLoop * numTopLoops + 1) + 1 * VerticesPerLoop
-    joinFace = 0
-    zHeight = (numTopLoops + 1) * H + topOffset
-    createCircularPolys(VerticesPerLoop, verts, faces, radius, zHeight, startVert, startFace, joinVert, joinFace)
-    
-    radius = rTop - thickness
-    startVert = N * (VerticesPerLoop * numTopLoops + 1) + 3 * VerticesPerLoop
-    startFace = (N-1) * VerticesPerLoop * numTopLoops + 3 * VerticesPerLoop
-    joinVert = N * (VerticesPerLoop * numTopLoops + 1) + 2 * VerticesPerLoop
-    joinFace = 0
-    zHeight = topOffset
-    createCircularPolys(VerticesPerLoop, verts, faces, radius, zHeight, startVert, startFace, joinVert, joinFace)
-    
-    startVert = N * (VerticesPerLoop * numTopLoops + 1) + 4 * VerticesPerLoop
-    startFace = (N-1) * VerticesPerLoop * numTopLoops + 4 * VerticesPerLoop
-    createThreads(VerticesPerLoop, verts, faces, startVert, startFace, numBottomLoops, RBottom, rBottom, h1, h2, h3, h4, falloffRate, bottomOffset, False)
-    
-    radius = rBottom - 7
-    startVert = N * (VerticesPerLoop * numTopLoops + 1) + N * (VerticesPerLoop * numBottomLoops + 1) + 6 * VerticesPerLoop
-    startFace = (N-1) * VerticesPerLoop * numTopLoops + (N-1) * VerticesPerLoop * numBottomLoops + 6 * VerticesPerLoop
-    joinVert = N * (VerticesPerLoop * numTopLoops + 1) + 4 * VerticesPerLoop
-    joinFace = 0
-    zHeight = bottomOffset
-    createCircularPolys(VerticesPerLoop, verts, faces, radius, zHeight, startVert, startFace, joinVert, joinFace)
-    
-    radius = rBottom - 7
-    startVert = N * (VerticesPerLoop * numTopLoops + 1) + N * (VerticesPerLoop * numBottomLoops + 1) + 7 * VerticesPerLoop
-    startFace = (N-1) * VerticesPerLoop * numTopLoops + (N-1) * VerticesPerLoop * numBottomLoops + 7 * VerticesPerLoop
-    joinVert = N * (VerticesPerLoop * numTopLoops + 1) + N * (VerticesPerLoop * numBottomLoops + 1) + 6 * VerticesPerLoop
-    joinFace = 0
-    zHeight = (numBottomLoops + 1) * H + bottomOffset
-    createCircularPolys(VerticesPerLoop, verts, faces, radius, zHeight, startVert, startFace, joinVert, joinFace)
-    
-    radius = rBottom - 7
-    startVert = N * (VerticesPerLoop * numTopLoops + 1) + N * (VerticesPerLoop * numBottomLoops + 1) + 8 * VerticesPerLoop
-    startFace = (N-1) * VerticesPerLoop * numTopLoops + (N-1) * VerticesPerLoop * numBottomLoops + 8 * VerticesPerLoop
-    joinVert = N * (VerticesPerLoop * numTopLoops + 1) + N * (VerticesPerLoop * numBottomLoops + 1) + 7 * VerticesPerLoop
-    joinFace = 0
-    zHeight = (topOffset - bottomOffset)/2 + bottomOffset
-    createCircularPolys(VerticesPerLoop, verts, faces, radius, zHeight, startVert, startFace, joinVert, joinFace)
-    
-    
-    radius = rTop - thickness
-    startVert = N * (VerticesPerLoop * numTopLoops + 1) + N * (VerticesPerLoop * numBottomLoops + 1) + 9 * VerticesPerLoop
-    startFace = (N-1) * VerticesPerLoop * numTopLoops + (N-1) * VerticesPerLoop * numBottomLoops + 9 * VerticesPerLoop
-    joinVert = N * (VerticesPerLoop * numTopLoops + 1) + 3 * VerticesPerLoop
-    joinFace = 0
-    zHeight = (topOffset - bottomOffset) / 2 + bottomOffset
-    createCircularPolys(VerticesPerLoop, verts, faces, radius, zHeight, startVert, startFace, joinVert, joinFace)
-    
-    
-    radius = rBottom
-    startVert = N * (VerticesPerLoop * numTopLoops + 1) + N * (VerticesPerLoop * numBottomLoops + 1) + 10 * VerticesPerLoop
-    startFace = (N-1) * VerticesPerLoop * numTopLoops + (N-1) * VerticesPerLoop * numBottomLoops + 10 * VerticesPerLoop
-    joinVert = N * (VerticesPerLoop * numTopLoops + 1) +  N * (VerticesPerLoop * numBottomLoops + 1) + 5 * VerticesPerLoop
-    joinFace = 0
-    zHeight = 2 * (topOffset - bottomOffset)/3 + bottomOffset
-    createCircularPolys(VerticesPerLoop, verts, faces, radius, zHeight, startVert, startFace, joinVert, joinFace)
-    
-    radius = rBottom - 7
-    startVert = N * (VerticesPerLoop * numTopLoops + 1) + N * (VerticesPerLoop * numBottomLoops + 1) + 11 * VerticesPerLoop
-    startFace = (N-1) * VerticesPerLoop * numTopLoops + (N-1) * VerticesPerLoop * numBottomLoops + 11 * VerticesPerLoop
-    joinVert = N * (VerticesPerLoop * numTopLoops + 1) + N * (VerticesPerLoop * numBottomLoops + 1) + 10 * VerticesPerLoop
-    joinFace = 0
-    zHeight = 2 * (topOffset - bottomOffset)/3 + bottomOffset
-    createCircularPolys(VerticesPerLoop, verts, faces, radius, zHeight, startVert, startFace, joinVert, joinFace)
-    
-    radius = rTop
-    startVert = N * (VerticesPerLoop * numTopLoops + 1) + N * (VerticesPerLoop * numBottomLoops + 1) + 12 * VerticesPerLoop
-    startFace = (N-1) * VerticesPerLoop * numTopLoops + (N-1) * VerticesPerLoop * numBottomLoops + 12 * VerticesPerLoop
-    joinVert = 0
-    joinFace = 0
-    zHeight = 2 * (topOffset - bottomOffset)/3 + bottomOffset
-    createCircularPolys(VerticesPerLoop, verts, faces, radius, zHeight, startVert, startFace, joinVert, joinFace)
-
-    startVert = N * (VerticesPerLoop * numTopLoops + 1) + N * (VerticesPerLoop * numBottomLoops + 1) + 9 * VerticesPerLoop
-    startFace = (N-1) * VerticesPerLoop * numTopLoops + (N-1) * VerticesPerLoop * numBottomLoops + 13 * VerticesPerLoop
-    joinVert = N * (VerticesPerLoop * numTopLoops + 1) + N * (VerticesPerLoop * numBottomLoops + 1) + 8 * VerticesPerLoop
-    joinCircularPolys(VerticesPerLoop, verts, faces, startVert, startFace, joinVert)
-    
-    startVert = N * (VerticesPerLoop * numTopLoops + 1) + N * (VerticesPerLoop * numBottomLoops + 1) + 11 * VerticesPerLoop
-    startFace = (N-1) * VerticesPerLoop * numTopLoops + (N-1) * VerticesPerLoop * numBottomLoops + 14 * VerticesPerLoop
-    joinVert = N * (VerticesPerLoop * numTopLoops + 1) + N * (VerticesPerLoop * numBottomLoops + 1) + 12 * VerticesPerLoop
-    joinCircularPolys(VerticesPerLoop, verts, faces, startVert, startFace, joinVert)
-    
-    return verts, faces
-
-def createHiltBase(VerticesPerLoop, numMaleLoops, numFemaleLoops, R, r, h1, h2, h3, h4, falloffRate, femaleOffset, maleOffset, radiiDiff, femaleThreads = False, numMaleThreads = 3, maleThickness = 2, femaleThickness = 3, locking = False):
-    # Code
+    half = (topOffset - bottomOffset)/2 + bottomOffset
+    twoThirds = 2 * (topOffset - bottomOffset)/3 + bottomOffset
+    return h1, h2, h3, h4, [
+        ('thread', numTopLoops, RTop, rTop, falloffRate, topOffset, False),
+        ('ring', rTop - thickness, (numTopLoops + 1) * H + topOffset),
+        ('ring', rTop - thickness, topOffset),
+        ('ring', rTop - thickness, half),
+        ('ring', rBottom - 7, half),
+        ('ring', rBottom - 7, (numBottomLoops + 1) * H + bottomOffset),
+        ('ring', rBottom - 7, bottomOffset),
+        ('thread', numBottomLoops, RBottom, rBottom, falloffRate, bottomOffset, False),
+        ('ring', rBottom, twoThirds),
+        ('ring', rBottom - 7, twoThirds),
+        ('ring', rTop, twoThirds),
+    ]
+
+def createCPMaleBase(VerticesPerLoop, numTopLoops, numBottomLoops, RTop, rTop, RBottom, rBottom, h1, h2, h3, h4, falloffRate, topOffset, bottomOffset, thickness=3, chordError=None, envelopes=False):
+    return compileOutline(VerticesPerLoop, *cpMaleBaseOutline(numTopLoops, numBottomLoops, RTop, rTop, RBottom, rBottom, h1, h2, h3, h4, falloffRate, topOffset, bottomOffset, thickness), chordError, envelopes)
+
+def hiltBaseOutline(numMaleLoops, numFemaleLoops, R, r, h1, h2, h3, h4, falloffRate, femaleOffset, maleOffset, radiiDiff, femaleThreads = False, numMaleThreads = 3, maleThickness = 2, femaleThickness = 3, locking = False):
     H = h1 + h2 + h3 + h4
-    N = 3
-    if h2 > 0:
-        N = N + 1
-    if h4 > 0:
-        N = N + 1
-
-    verts = [[0, 0, 0] for _ in range(N * (VerticesPerLoop * numMaleLoops + 1) + N * (VerticesPerLoop * numFemaleLoops + 1) + 12*VerticesPerLoop)]
-    faces = [[0, 0, 0, 0] for _ in range(( N - 1) * VerticesPerLoop * numMaleLoops + ( N - 1) * VerticesPerLoop * numFemaleLoops  + 14*VerticesPerLoop) ]
-   
-    startVert = 0
-    startFace = 0
-    femaleThreads = False
-    createThreads(VerticesPerLoop, verts, faces, startVert, startFace, numMaleLoops, R - radiiDiff, r - radiiDiff, h1, h2, h3, h4, falloffRate, maleOffset, femaleThreads)
-   
-    radius = r - maleThickness - radiiDiff
-    startVert = N * (VerticesPerLoop * numMaleLoops + 1) + 2 * VerticesPerLoop
-    startFace = (N-1) * VerticesPerLoop * numMaleLoops + 2 * VerticesPerLoop
-    joinVert = 0
-    joinFace = 0
-    zHeight = maleOffset
-    createCircularPolys(VerticesPerLoop, verts, faces, radius, zHeight, startVert, startFace, joinVert, joinFace)
-   
-    radius = r - maleThickness - radiiDiff
-    startVert = N * (VerticesPerLoop * numMaleLoops + 1) + 3 * VerticesPerLoop
-    startFace = (N-1) * VerticesPerLoop * numMaleLoops + 3 * VerticesPerLoop
-    joinVert = N * (VerticesPerLoop * numMaleLoops + 1) + 2 * VerticesPerLoop
-    joinFace = 0
-    zHeight = (numMaleLoops + 1)* H + maleOffset
-    createCircularPolys(VerticesPerLoop, verts, faces, radius, zHeight, startVert, startFace, joinVert, joinFace)
-   
-    startVert = N * (VerticesPerLoop * numMaleLoops + 1) + 4 * VerticesPerLoop
-    startFace = (N-1) * VerticesPerLoop * numMaleLoops + 4 * VerticesPerLoop
-    femaleThreads = True
-    createThreads(VerticesPerLoop, verts, faces, startVert, startFace, numFemaleLoops, R, r, h1, h2, h3, h4, 1000, femaleOffset, femaleThreads)
-   
-    # For  female threads...
-    radius = r
-    startVert = N * (VerticesPerLoop * numMaleLoops + 1) + N * (VerticesPerLoop * numFemaleLoops + 1) + 6 * VerticesPerLoop
-    startFace = (N-1) * VerticesPerLoop * numMaleLoops + (N-1) * VerticesPerLoop * numFemaleLoops + 6 * VerticesPerLoop
-    joinVert = N * (VerticesPerLoop * numMaleLoops + 1) + N * (VerticesPerLoop * numFemaleLoops + 1) + 5 * VerticesPerLoop
-    joinFace = 0
-    zHeight = numFemaleLoops * H + femaleOffset + 0.2
-    createCircularPolys(VerticesPerLoop, verts, faces, radius, zHeight, startVert, startFace, joinVert, joinFace)
-   
-    radius = R + femaleThickness
-    startVert = N * (VerticesPerLoop * numMaleLoops + 1) + N * (VerticesPerLoop * numFemaleLoops + 1) + 7 * VerticesPerLoop
-    startFace = (N-1) * VerticesPerLoop * numMaleLoops + (N-1) * VerticesPerLoop * numFemaleLoops + 7 * VerticesPerLoop
-    joinVert = N * (VerticesPerLoop * numMaleLoops + 1) + N * (VerticesPerLoop * numFemaleLoops + 1) + 6 * VerticesPerLoop
-    joinFace = 0
-    zHeight = numFemaleLoops * H + femaleOffset + 0.2
-    createCircularPolys(VerticesPerLoop, verts, faces, radius, zHeight, startVert, startFace, joinVert, joinFace)
-   
-    radius = R + femaleThickness
-    startVert = N * (VerticesPerLoop * numMaleLoops + 1) + N * (VerticesPerLoop * numFemaleLoops + 1) + 8 * VerticesPerLoop
-    startFace = (N-1) * VerticesPerLoop * numMaleLoops + (N-1) * VerticesPerLoop * numFemaleLoops + 8 * VerticesPerLoop
-    joinVert = N * (VerticesPerLoop * numMaleLoops + 1) + N * (VerticesPerLoop * numFemaleLoops + 1) + 7 * VerticesPerLoop
-    joinFace = 0
-    zHeight = femaleOffset
-    createCircularPolys(VerticesPerLoop, verts, faces, radius, zHeight, startVert, startFace, joinVert, joinFace)
-   
-    radius = R + femaleThickness
-    startVert = N * (VerticesPerLoop * numMaleLoops + 1) + N * (VerticesPerLoop * numFemaleLoops + 1) + 9 * VerticesPerLoop
-    startFace = (N-1) * VerticesPerLoop * numMaleLoops + (N-1) * VerticesPerLoop * numFemaleLoops + 9 * VerticesPerLoop
-    joinVert = N * (VerticesPerLoop * numMaleLoops + 1) + N * (VerticesPerLoop * numFemaleLoops + 1) + 8 * VerticesPerLoop
-    joinFace = 0
-    zHeight = maleOffset + (numMaleLoops + 1) * H
-    createCircularPolys(VerticesPerLoop, verts, faces, radius, zHeight, startVert, startFace, joinVert, joinFace)
-    
-    if locking:
-        radius = r - maleThickness - radiiDiff
-    else:
-        radius = r
-    startVert = N * (VerticesPerLoop * numMaleLoops + 1) + N * (VerticesPerLoop * numFemaleLoops + 1) + 10 * VerticesPerLoop
-    startFace = (N-1) * VerticesPerLoop * numMaleLoops + (N-1) * VerticesPerLoop * numFemaleLoops + 10 * VerticesPerLoop
-    joinVert = N * (VerticesPerLoop * numMaleLoops + 1) + 4 * VerticesPerLoop
-    joinFace = 0
+    top = maleOffset + (numMaleLoops + 1) * H
+    bore = r - maleThickness - radiiDiff
+    # A locking hilt narrows to the bore right below the female threads,
+    # otherwise only just above the male ones.
     if locking:
-        zHeight = femaleOffset
+        narrowing = ('ring', bore, femaleOffset)
     else:
-        zHeight = maleOffset + (numMaleLoops + 1) * H + 3
-    createCircularPolys(VerticesPerLoop, verts, faces, radius, zHeight, startVert, startFace, joinVert, joinFace)
-    
-    # Using previous radius for this loop
-    radius = r - maleThickness - radiiDiff
-    startVert = N * (VerticesPerLoop * numMaleLoops + 1) + N * (VerticesPerLoop * numFemaleLoops + 1) + 11 * VerticesPerLoop
-    startFace = (N-1) * VerticesPerLoop * numMaleLoops + (N-1) * VerticesPerLoop * numFemaleLoops + 11 * VerticesPerLoop
-    joinVert = N * (VerticesPerLoop * numMaleLoops + 1) + 3 * VerticesPerLoop
-    joinFace = 0
-    zHeight = maleOffset + (numMaleLoops + 1) * H + 1
-    createCircularPolys(VerticesPerLoop, verts, faces, radius, zHeight, startVert, startFace, joinVert, joinFace)
-    
-    startVert = N * (VerticesPerLoop * numMaleLoops + 1) + N * (VerticesPerLoop * numFemaleLoops + 1) + 9 * VerticesPerLoop
-    startFace = (N-1) * VerticesPerLoop * numMaleLoops + (N-1) * VerticesPerLoop * numFemaleLoops + 12 * VerticesPerLoop
-    joinVert = N * (VerticesPerLoop * numMaleLoops + 1) + VerticesPerLoop
-    joinCircularPolys(VerticesPerLoop, verts, faces, startVert, startFace, joinVert)
-    
-    startVert = N * (VerticesPerLoop * numMaleLoops + 1) + N * (VerticesPerLoop * numFemaleLoops + 1) + 10* VerticesPerLoop
-    startFace = (N-1) * VerticesPerLoop * numMaleLoops + (N-1) * VerticesPerLoop * numFemaleLoops + 13 * VerticesPerLoop
-    joinVert = N * (VerticesPerLoop * numMaleLoops + 1) + N * (VerticesPerLoop * numFemaleLoops + 1) + 11 * VerticesPerLoop
-    joinCircularPolys(VerticesPerLoop, verts, faces, startVert, startFace, joinVert)
-    
-    return verts, faces
-
-def createPommelBase(VerticesPerLoop, numFemaleLoops, R, r, h1, h2, h3, h4, falloffRate, femaleOffset, thickness):
-    # Code
+        narrowing = ('ring', r, top + 3)
+    return h1, h2, h3, h4, [
+        ('thread', numMaleLoops, R - radiiDiff, r - radiiDiff, falloffRate, maleOffset, False),
+        ('ring', R + femaleThickness, top),
+        ('ring', R + femaleThickness, femaleOffset),
+        ('ring', R + femaleThickness, numFemaleLoops * H + femaleOffset + 0.2),
+        ('ring', r, numFemaleLoops * H + femaleOffset + 0.2),
+        ('thread', numFemaleLoops, R, r, 1000, femaleOffset, True),
+        narrowing,
+        ('ring', bore, top + 1),
+        ('ring', bore, top),
+        ('ring', bore, maleOffset),
+    ]
+
+def createHiltBase(VerticesPerLoop, numMaleLoops, numFemaleLoops, R, r, h1, h2, h3, h4, falloffRate, femaleOffset, maleOffset, radiiDiff, femaleThreads = False, numMaleThreads = 3, maleThickness = 2, femaleThickness = 3, locking = False, chordError = None, envelopes = False):
+    return compileOutline(VerticesPerLoop, *hiltBaseOutline(numMaleLoops, numFemaleLoops, R, r, h1, h2, h3, h4, falloffRate, femaleOffset, maleOffset, radiiDiff, femaleThreads, numMaleThreads, maleThickness, femaleThickness, locking), chordError, envelopes)
+
+def pommelBaseOutline(numFemaleLoops, R, r, h1, h2, h3, h4, falloffRate, femaleOffset, thickness):
     H = h1 + h2 + h3 + h4
-    N = 3
-    if h2 > 0:
-        N = N + 1
-    if h4 > 0:
-        N = N + 1
-
-    verts = [[0, 0, 0] for _ in range(N * (VerticesPerLoop * numFemaleLoops + 1) + 7*VerticesPerLoop)]
-    faces = [[0, 0, 0, 0] for _ in range(( N - 1) * VerticesPerLoop * numFemaleLoops  + 7*VerticesPerLoop) ]
-   
-    startVert = 0
-    startFace = 0
-    createThreads(VerticesPerLoop, verts, faces, startVert, startFace, numFemaleLoops, R, r, h1, h2, h3, h4, falloffRate, femaleOffset + 10, True)
-   
-    # For  female threads...
-    radius = r
-    startVert = N * (VerticesPerLoop * numFemaleLoops + 1) + 2 * VerticesPerLoop
-    startFace = (N-1) * VerticesPerLoop * numFemaleLoops + 2 * VerticesPerLoop
-    joinVert = N * (VerticesPerLoop * numFemaleLoops + 1) + VerticesPerLoop
-    joinFace = 0
-    zHeight = numFemaleLoops * H + femaleOffset + 10 + 0.2
-    createCircularPolys(VerticesPerLoop, verts, faces, radius, zHeight, startVert, startFace, joinVert, joinFace)
-   
-    radius = R + thickness
-    startVert = N * (VerticesPerLoop * numFemaleLoops + 1) + 3 * VerticesPerLoop
-    startFace = (N-1) * VerticesPerLoop * numFemaleLoops + 3 * VerticesPerLoop
-    joinVert = N * (VerticesPerLoop * numFemaleLoops + 1) + 2 * VerticesPerLoop
-    joinFace = 0
-    zHeight = numFemaleLoops * H + femaleOffset + 10 + 0.2
-    createCircularPolys(VerticesPerLoop, verts, faces, radius, zHeight, startVert, startFace, joinVert, joinFace)
-   
-    radius = R + thickness
-    startVert = N * (VerticesPerLoop * numFemaleLoops + 1) + 4 * VerticesPerLoop
-    startFace = (N-1) * VerticesPerLoop * numFemaleLoops + 4 * VerticesPerLoop
-    joinVert = N * (VerticesPerLoop * numFemaleLoops + 1) + 3 * VerticesPerLoop
-    joinFace = 0
-    zHeight = femaleOffset
-    createCircularPolys(VerticesPerLoop, verts, faces, radius, zHeight, startVert, startFace, joinVert, joinFace)
-    
-    radius = r
-    startVert = N * (VerticesPerLoop * numFemaleLoops + 1) + 5 * VerticesPerLoop
-    startFace = (N-1) * VerticesPerLoop * numFemaleLoops + 5 * VerticesPerLoop
-    joinVert = N * (VerticesPerLoop * numFemaleLoops + 1) + 4 * VerticesPerLoop
-    joinFace = 0
-    zHeight = femaleOffset
-    createCircularPolys(VerticesPerLoop, verts, faces, radius, zHeight, startVert, startFace, joinVert, joinFace)
-    
-    startVert = N * (VerticesPerLoop * numFemaleLoops + 1) + 6 * VerticesPerLoop
-    startFace = (N-1) * VerticesPerLoop * numFemaleLoops + 6 * VerticesPerLoop
-    joinVert = 0
-    joinFace = 0
-    zHeight = femaleOffset
-    createCircularPolys(VerticesPerLoop, verts, faces, radius, zHeight, startVert, startFace, joinVert, joinFace)
-    
-    return verts, faces
-
-def createBladeHolder(VerticesPerLoop, numMaleThreads, Rmale, rmale, h1, h2, h3, h4, maleThickness, femaleThickness):
+    top = numFemaleLoops * H + femaleOffset + 10 + 0.2
+    return h1, h2, h3, h4, [
+        ('thread', numFemaleLoops, R, r, falloffRate, femaleOffset + 10, True),
+        ('ring', r, femaleOffset),
+        ('ring', R + thickness, femaleOffset),
+        ('ring', R + thickness, top),
+        ('ring', r, top),
+    ]
+
+def createPommelBase(VerticesPerLoop, numFemaleLoops, R, r, h1, h2, h3, h4, falloffRate, femaleOffset, thickness, chordError=None, envelopes=False):
+    return compileOutline(VerticesPerLoop, *pommelBaseOutline(numFemaleLoops, R, r, h1, h2, h3, h4, falloffRate, femaleOffset, thickness), chordError, envelopes)
+
+def bladeHolderOutline(numMaleThreads, Rmale, rmale, h1, h2, h3, h4, maleThickness, femaleThickness):
     maleOffset = 100
-    verts, faces = createBladeBase(VerticesPerLoop, numMaleThreads, Rmale, rmale, h1,  h2, h3, h4, 1, maleOffset, maleThickness, femaleThickness)
-    createMeshFromData( 'BladeHolder', [0, 0, 0], verts, [], faces )
+    return bladeBaseOutline(numMaleThreads, Rmale, rmale, h1,  h2, h3, h4, 1, maleOffset, maleThickness, femaleThickness)
+
+def buildBladeHolder(VerticesPerLoop, numMaleThreads, Rmale, rmale, h1, h2, h3, h4, maleThickness, femaleThickness, chordError=None, envelopes=False):
+    return compileOutline(VerticesPerLoop, *bladeHolderOutline(numMaleThreads, Rmale, rmale, h1, h2, h3, h4, maleThickness, femaleThickness), chordError, envelopes)
 
-def createCPFemaleToFemale(VerticesPerLoop, numTopThreads, numBottomThreads, RTop, rTop, RBottom, rBottom, h1, h2, h3, h4, thickness):
+def cpFemaleToFemaleOutline(numTopThreads, numBottomThreads, RTop, rTop, RBottom, rBottom, h1, h2, h3, h4, thickness):
     topOffset = 100
     bottomOffset = 70
-    verts, faces = createCPFemaleBase(VerticesPerLoop, numTopThreads, numBottomThreads, RTop, rTop, RBottom, rBottom, h1,  h2, h3, h4, 1000, topOffset, bottomOffset, thickness)
-    createMeshFromData( 'CPFemaleHolder', [0, 0, 0], verts, [], faces )
+    return cpFemaleBaseOutline(numTopThreads, numBottomThreads, RTop, rTop, RBottom, rBottom, h1,  h2, h3, h4, 1000, topOffset, bottomOffset, thickness)
 
-def createCPMaleToMale(VerticesPerLoop, numTopThreads, numBottomThreads, RTop, rTop, RBottom, rBottom, h1, h2, h3, h4, thickness):
+def buildCPFemaleToFemale(VerticesPerLoop, numTopThreads, numBottomThreads, RTop, rTop, RBottom, rBottom, h1, h2, h3, h4, thickness, chordError=None, envelopes=False):
+    return compileOutline(VerticesPerLoop, *cpFemaleToFemaleOutline(numTopThreads, numBottomThreads, RTop, rTop, RBottom, rBottom, h1, h2, h3, h4, thickness), chordError, envelopes)
+
+def cpMaleToMaleOutline(numTopThreads, numBottomThreads, RTop, rTop, RBottom, rBottom, h1, h2, h3, h4, thickness):
     topOffset = 70
     bottomOffset = 45
-    verts, faces = createCPMaleBase(VerticesPerLoop, numTopThreads, numBottomThreads, RTop, rTop, RBottom, rBottom, h1,  h2, h3, h4, 1, topOffset, bottomOffset, thickness)
-    createMeshFromData( 'CPMaleHolder', [0, 0, 0], verts, [], faces )
+    return cpMaleBaseOutline(numTopThreads, numBottomThreads, RTop, rTop, RBottom, rBottom, h1,  h2, h3, h4, 1, topOffset, bottomOffset, thickness)
+
+def buildCPMaleToMale(VerticesPerLoop, numTopThreads, numBottomThreads, RTop, rTop, RBottom, rBottom, h1, h2, h3, h4, thickness, chordError=None, envelopes=False):
+    return compileOutline(VerticesPerLoop, *cpMaleToMaleOutline(numTopThreads, numBottomThreads, RTop, rTop, RBottom, rBottom, h1, h2, h3, h4, thickness), chordError, envelopes)
 
-def createHilt(VerticesPerLoop, numMaleThreads, numFemaleThreads, RFemale, rFemale, h1, h2, h3, h4, radiiDiff, maleThickness, femaleThickness, locking=False):
+def hiltOutline(numMaleThreads, numFemaleThreads, RFemale, rFemale, h1, h2, h3, h4, radiiDiff, maleThickness, femaleThickness, locking=False):
     femaleOffset = 150
     maleOffset = 0
-    verts, faces = createHiltBase(VerticesPerLoop, numMaleThreads, numFemaleThreads, RFemale, rFemale, h1,  h2, h3, h4, 1, femaleOffset, maleOffset, radiiDiff, True, numMaleThreads, maleThickness, femaleThickness, locking)
-    createMeshFromData( 'Hilt', [0, 0, 0], verts, [], faces )
+    return hiltBaseOutline(numMaleThreads, numFemaleThreads, RFemale, rFemale, h1,  h2, h3, h4, 1, femaleOffset, maleOffset, radiiDiff, True, numMaleThreads, maleThickness, femaleThickness, locking)
 
-def createPommel(VerticesPerLoop, numFemaleThreads, RFemale, rFemale, h1, h2, h3, h4, thickness):
+def buildHilt(VerticesPerLoop, numMaleThreads, numFemaleThreads, RFemale, rFemale, h1, h2, h3, h4, radiiDiff, maleThickness, femaleThickness, locking=False, chordError=None, envelopes=False):
+    return compileOutline(VerticesPerLoop, *hiltOutline(numMaleThreads, numFemaleThreads, RFemale, rFemale, h1, h2, h3, h4, radiiDiff, maleThickness, femaleThickness, locking), chordError, envelopes)
+
+def pommelOutline(numFemaleThreads, RFemale, rFemale, h1, h2, h3, h4, thickness):
     femaleOffset = 0
-    verts, faces = createPommelBase(VerticesPerLoop, numFemaleThreads, RFemale, rFemale, h1,  h2, h3, h4, 1000, femaleOffset, thickness)
-    createMeshFromData( 'Pommel', [0, 0, 0], verts, [], faces )
-    
-# The Blade Holder should have a thread radius of 18.5 and 17.2 in order to  hold the circuit board holder correctly.
-createBladeHolder(256, 2, 18.5, 17.2, 0.8, 0.2, 0.8, 0.3, 2, 3)
-#createCPFemaleToFemale(256, 3, 3, 18.5, 17.2, 30.0, 28.7, 0.8, 0.2, 0.8, 0.3, 1)
-#createCPMaleToMale(256, 3, 3, 19.0, 17.7, 29.5, 28.2, 0.8, 0.2, 0.8, 0.3, 2)
-createHilt(256, 3, 5, 19.5, 18.2, 0.8, 0.2, 0.8, 0.3, 0.5, 2, 2, False)
-createPommel(256, 5, 19.5, 18.2, 0.8, 0.2, 0.8, 0.3, 2)
+    return pommelBaseOutline(numFemaleThreads, RFemale, rFemale, h1,  h2, h3, h4, 1000, femaleOffset, thickness)
+
+def buildPommel(VerticesPerLoop, numFemaleThreads, RFemale, rFemale, h1, h2, h3, h4, thickness, chordError=None, envelopes=False):
+    return compileOutline(VerticesPerLoop, *pommelOutline(numFemaleThreads, RFemale, rFemale, h1, h2, h3, h4, thickness), chordError, envelopes)
+
+def createBladeHolder(VerticesPerLoop, numMaleThreads, Rmale, rmale, h1, h2, h3, h4, maleThickness, femaleThickness, chordError=None, envelopes=False, preview=False):
+    createParts([('bladeholder', (VerticesPerLoop, numMaleThreads, Rmale, rmale, h1, h2, h3, h4, maleThickness, femaleThickness, chordError, envelopes))], preview=preview)
+
+def createCPFemaleToFemale(VerticesPerLoop, numTopThreads, numBottomThreads, RTop, rTop, RBottom, rBottom, h1, h2, h3, h4, thickness, chordError=None, envelopes=False, preview=False):
+    createParts([('cpfemale', (VerticesPerLoop, numTopThreads, numBottomThreads, RTop, rTop, RBottom, rBottom, h1, h2, h3, h4, thickness, chordError, envelopes))], preview=preview)
+
+def createCPMaleToMale(VerticesPerLoop, numTopThreads, numBottomThreads, RTop, rTop, RBottom, rBottom, h1, h2, h3, h4, thickness, chordError=None, envelopes=False, preview=False):
+    createParts([('cpmale', (VerticesPerLoop, numTopThreads, numBottomThreads, RTop, rTop, RBottom, rBottom, h1, h2, h3, h4, thickness, chordError, envelopes))], preview=preview)
+
+def createHilt(VerticesPerLoop, numMaleThreads, numFemaleThreads, RFemale, rFemale, h1, h2, h3, h4, radiiDiff, maleThickness, femaleThickness, locking=False, chordError=None, envelopes=False, preview=False):
+    createParts([('hilt', (VerticesPerLoop, numMaleThreads, numFemaleThreads, RFemale, rFemale, h1, h2, h3, h4, radiiDiff, maleThickness, femaleThickness, locking, chordError, envelopes))], preview=preview)
+
+def createPommel(VerticesPerLoop, numFemaleThreads, RFemale, rFemale, h1, h2, h3, h4, thickness, chordError=None, envelopes=False, preview=False):
+    createParts([('pommel', (VerticesPerLoop, numFemaleThreads, RFemale, rFemale, h1, h2, h3, h4, thickness, chordError, envelopes))], preview=preview)
+
+# Command line name, object name and builder of every part.
+PARTS = {
+    'bladeholder': ('BladeHolder', buildBladeHolder),
+    'cpfemale': ('CPFemaleHolder', buildCPFemaleToFemale),
+    'cpmale': ('CPMaleHolder', buildCPMaleToMale),
+    'hilt': ('Hilt', buildHilt),
+    'pommel': ('Pommel', buildPommel),
+}
+
+# Starting values of every part in the add-on, the same as the calls at the
+# bottom of the file.
+DEFAULTS = {
+    'bladeholder': (256, 2, 18.5, 17.2, 0.8, 0.2, 0.8, 0.3, 2, 3),
+    'cpfemale': (256, 3, 3, 18.5, 17.2, 30.0, 28.7, 0.8, 0.2, 0.8, 0.3, 1),
+    'cpmale': (256, 3, 3, 19.0, 17.7, 29.5, 28.2, 0.8, 0.2, 0.8, 0.3, 2),
+    'hilt': (256, 3, 5, 19.5, 18.2, 0.8, 0.2, 0.8, 0.3, 0.5, 2, 2, False),
+    'pommel': (256, 5, 19.5, 18.2, 0.8, 0.2, 0.8, 0.3, 2),
+}
+
+# The outline of every part, taking the arguments of its builder but for
+# VerticesPerLoop, chordError and envelopes.
+OUTLINES = {
+    'bladeholder': bladeHolderOutline,
+    'cpfemale': cpFemaleToFemaleOutline,
+    'cpmale': cpMaleToMaleOutline,
+    'hilt': hiltOutline,
+    'pommel': pommelOutline,
+}
+
+def partOutline(part, args):
+    # The compileOutline arguments a part is built from, without building it.
+    bound = inspect.signature(PARTS[part][1]).bind(*args)
+    bound.apply_defaults()
+    arguments = dict(bound.arguments)
+    VerticesPerLoop = arguments.pop('VerticesPerLoop')
+    chordError = arguments.pop('chordError')
+    envelopes = arguments.pop('envelopes')
+    return (VerticesPerLoop,) + OUTLINES[part](**arguments) + (chordError, envelopes)
+
+def partThreads(part, args):
+    # The threads of a part as (h1, h2, h3, h4, Loops, R, r, falloffRate,
+    # zoffset, femaleThreads) rows, read from its outline without building it.
+    VerticesPerLoop, h1, h2, h3, h4, outline, chordError, envelopes = partOutline(part, args)
+    return [(h1, h2, h3, h4) + tuple(entry[1:]) for entry in outline if entry[0] == 'thread']
+
+def threadSurface(angle, z, h1, h2, h3, h4, Loops, R, r, falloffRate, zoffset):
+    # Radius of the surface createThreads makes at the given angle and height,
+    # for arrays of any of them. Outside the helix it is the plain wall at r.
+    H = h1 + h2 + h3 + h4
+    along = z - zoffset - angle / (2 * pi) * H
+    turn = np.floor(along / H)
+    phase = along - turn * H
+    tooth = np.clip(np.minimum(phase / h1, (h1 + h2 + h3 - phase) / h3), 0, 1)
+    # The crest only changes from turn to turn, so it is worked out once for
+    # every turn and angle and looked up from there.
+    turns = np.arange(turn.min(), turn.max() + 1)
+    t, Loops, R, r, falloffRate = [np.expand_dims(value, -1) for value in (angle / (2 * pi), Loops, R, r, falloffRate)]
+    t = t + turns
+    height = np.where((t >= 0) & (t <= Loops), threadFalloff(np.clip(t / Loops, 0, 1), R, r, falloffRate) - r, 0)
+    index = (turn - turns[0]).astype(np.intp)[..., None]
+    height = height.reshape((1,) * (index.ndim - height.ndim) + height.shape)
+    return r[..., 0] + tooth * np.take_along_axis(height, index, axis=-1)[..., 0]
+
+def threadFit(male, female, angles=4, shifts=32):
+    # How well male threads screw into female ones, for many pairs at once.
+    # male and female are arrays of (h1, h2, h3, h4, Loops, R, r, falloffRate,
+    # zoffset) rows that broadcast against each other. The male thread is
+    # centred on the female one and turned to where it fits best. Returns
+    # three arrays, in mm: the smallest radial gap between the two surfaces
+    # (negative where they overlap), the axial play the male has without
+    # touching (at most one pitch), and the length over which the teeth
+    # engage.
+    male, female = np.broadcast_arrays(np.atleast_2d(np.asarray(male, dtype=np.float64))[:, :9],
+                                       np.atleast_2d(np.asarray(female, dtype=np.float64))[:, :9])
+    clearance = np.empty(len(male))
+    play = np.empty(len(male))
+    engaged = np.empty(len(male))
+    # Chunks keep the (pair, angle, shift, point) arrays small.
+    for start in range(0, len(male), 256):
+        chunk = slice(start, start + 256)
+        clearance[chunk], play[chunk], engaged[chunk] = fitChunk(male[chunk], female[chunk], angles, shifts)
+    return clearance, play, engaged
+
+def fitChunk(male, female, angles, shifts):
+    # Arrays are indexed [pair, angle, shift, point].
+    m = [column[:, None, None, None] for column in male.T]
+    f = [column[:, None, None, None] for column in female.T]
+    mH = m[0] + m[1] + m[2] + m[3]
+    fH = f[0] + f[1] + f[2] + f[3]
+    angle = (np.arange(angles) * 2 * pi / angles)[None, :, None, None]
+    shift = (np.arange(shifts) / shifts - 0.5)[None, None, :, None] * fH
+    centred = f[8] + f[4] * fH / 2 - (m[4] + 1) * mH / 2
+    zoffset = centred + shift
+    low = np.maximum(f[8], zoffset)
+    high = np.minimum(f[8] + f[4] * fH, zoffset + (m[4] + 1) * mH)
+
+    # Both surfaces are straight between the corners of their profiles, so
+    # the gap is smallest at a corner of one or the other, or at an end. At
+    # its own corners a surface is the same whatever the shift.
+    def corners(h, H, offset, turns):
+        base = offset + angle / (2 * pi) * H + np.arange(-1, turns) * H
+        return np.concatenate([base + corner for corner in (0 * H, h[0], h[0] + h[1], h[0] + h[1] + h[2])], axis=-1)
+    def inside(z, gap):
+        return np.where((z >= low) & (z <= high), gap, np.inf).min(axis=(1, 3))
+    z = corners(f, fH, f[8], int(f[4].max()))
+    gap = inside(z, threadSurface(angle, z, *f[:9]) - threadSurface(angle, z, *m[:8], zoffset))
+    z = corners(m, mH, centred, int(m[4].max()) + 1)
+    radius = threadSurface(angle, z, *m[:8], centred)
+    z = z + shift
+    gap = np.minimum(gap, inside(z, threadSurface(angle, z, *f[:9]) - radius))
+    for z in (low, high):
+        gap = np.minimum(gap, inside(z, threadSurface(angle, z, *f[:9]) - threadSurface(angle, z, *m[:8], zoffset)))
+    best = np.argmax(gap, axis=1)
+    clearance = gap[np.arange(len(gap)), best]
+    play = (gap >= 0).sum(axis=1) * fH[:, 0, 0, 0] / shifts
+
+    # Walk along the crest of the male thread at its best shift and count
+    # where it reaches past the female crest into a groove that is there.
+    steps = 16
+    t = (np.arange(int(m[4].max()) * steps) + 0.5) / steps
+    m = [value[:, 0, 0, 0, None] for value in m]
+    f = [value[:, 0, 0, 0, None] for value in f]
+    mH, fH = mH[:, 0, 0, 0, None], fH[:, 0, 0, 0, None]
+    z = zoffset[np.arange(len(gap)), 0, best, 0][:, None] + t * mH + m[0] + m[1] / 2
+    crest = threadFalloff(np.clip(t / m[4], 0, 1), m[5], m[6], m[7])
+    reach = (t < m[4]) & (crest > f[6]) & (threadSurface(0, z, *f[:9]) > f[6])
+    engaged = reach.sum(axis=1) * mH[:, 0] / steps
+    return clearance, play, engaged
+
+def fitParts(males, females):
+    # threadFit for every male part in males screwed into every female part
+    # in females, both lists of (part, args). Of each pair of parts the male
+    # and female threads closest in size are compared. Returns the three
+    # threadFit arrays with a row for every male and a column for every
+    # female part, nan where a pair has no threads to compare.
+    maleThreads = [[thread for thread in partThreads(part, args) if not thread[9]] for part, args in males]
+    femaleThreads = [[thread for thread in partThreads(part, args) if thread[9]] for part, args in females]
+    pairs = []
+    threads = []
+    for i, ours in enumerate(maleThreads):
+        for j, theirs in enumerate(femaleThreads):
+            if ours and theirs:
+                pairs.append((i, j))
+                threads.append(min(((male, female) for male in ours for female in theirs), key=lambda pair: abs(pair[0][5] - pair[1][5])))
+    results = [np.full((len(males), len(females)), np.nan) for _ in range(3)]
+    if pairs:
+        rows, columns = zip(*pairs)
+        for result, values in zip(results, threadFit(*zip(*threads))):
+            result[rows, columns] = values
+    return results
+
+# Filament the estimates are for: diameter in mm and density in g/cm³ of PLA,
+# and the flow in mm³/s a typical printer keeps up with it.
+FILAMENT_DIAMETER = 1.75
+FILAMENT_DENSITY = 1.24
+PRINT_FLOW = 8.0
+
+def threadMeasure(Loops, R, r, h1, h2, h3, h4, falloffRate, zoffset, femaleThreads=False, samples=1024):
+    # Volume between the surface of a thread and the axis, and the area of
+    # that surface, from its parameters alone. The surface is followed along
+    # the helix at samples places, more of them towards the ends where a
+    # steep falloffRate makes the crest shoot up, and across the profile
+    # exactly.
+    H = h1 + h2 + h3 + h4
+    t = Loops * (1 - np.cos(np.linspace(0, pi, samples))) / 2
+    # Trapezoid rule weights along the helix.
+    step = np.zeros(samples)
+    step[1:] += np.diff(t) / 2
+    step[:-1] += np.diff(t) / 2
+    tooth = np.array([0, 1, 1, 0, 0])
+    rho = r + tooth * (threadFalloff(t / Loops, R, r, falloffRate) - r)[:, None]
+    z = np.array([0, h1, h1 + h2, h1 + h2 + h3, H]) + t[:, None] * H + zoffset
+    if femaleThreads:
+        np.minimum(z, Loops * H + zoffset, out=z)
+    # Each piece of the profile is a straight line, so around the axis it
+    # sweeps pi * (a² + ab + b²) / 3 * dz for every turn.
+    a, b = rho[:, :-1], rho[:, 1:]
+    volume = pi * ((a * a + a * b + b * b) / 3 * np.diff(z, axis=1)).sum(axis=1) @ step
+
+    # Across a piece the area is taken at Gauss points, along the helix
+    # from how its corners move.
+    sigma, weight = np.polynomial.legendre.leggauss(4)
+    sigma = (sigma[:, None, None] + 1) / 2
+    rhoT = np.gradient(rho, t, axis=0)
+    zT = np.gradient(z, t, axis=0)
+    radius = a + sigma * (b - a)
+    radiusT = rhoT[:, :-1] + sigma * (rhoT[:, 1:] - rhoT[:, :-1])
+    heightT = zT[:, :-1] + sigma * (zT[:, 1:] - zT[:, :-1])
+    dRho, dZ = b - a, np.diff(z, axis=1)
+    cross = (dRho * dRho + dZ * dZ) * (radiusT * radiusT + (2 * pi * radius) ** 2 + heightT * heightT) - (dRho * radiusT + dZ * heightT) ** 2
+    area = (np.sqrt(np.maximum(cross, 0)) * weight[:, None, None] / 2).sum(axis=(0, 2)) @ step
+
+    # Below the first turn and above the last the wall is plain, out to
+    # where the helix starts and ends.
+    volume += pi * r * r * H / 2 * (1 if femaleThreads else 2)
+    area += pi * r * H * (1 if femaleThreads else 2)
+    return volume, area
+
+def outlineEnds(h1, h2, h3, h4, outline):
+    # Where the outline enters and leaves each entry, as (radius, z) pairs,
+    # the same as in OutlinePlan. A thread is a plain wall at its root there.
+    H = h1 + h2 + h3 + h4
+    ends = []
+    for entry in outline:
+        if entry[0] == 'ring':
+            ends.append((entry[1:], entry[1:]))
+            continue
+        _, Loops, R, r, falloffRate, zoffset, femaleThreads = entry
+        if femaleThreads:
+            ends.append(((r, Loops * H + zoffset), (r, zoffset)))
+        else:
+            ends.append(((r, zoffset), (r, (Loops + 1) * H + zoffset)))
+    return ends
+
+def partMeasure(part, args):
+    # Volume in mm³ and surface area in mm² of a part, worked out from its
+    # outline instead of a mesh: the bands between its rings are cones and
+    # the threads come from threadMeasure. It is the part as it is meant to
+    # be, so VerticesPerLoop, chordError and envelopes make no difference.
+    VerticesPerLoop, h1, h2, h3, h4, outline, chordError, envelopes = partOutline(part, args)
+    volume = 0
+    area = 0
+    for entry in outline:
+        if entry[0] == 'thread':
+            threadVolume, threadArea = threadMeasure(*entry[1:4], h1, h2, h3, h4, *entry[4:])
+            area += threadArea
+            volume += -threadVolume if entry[6] else threadVolume
+    ends = outlineEnds(h1, h2, h3, h4, outline)
+    for (_, (ra, za)), ((rb, zb), _) in zip(ends, ends[1:] + ends[:1]):
+        volume += pi * (ra * ra + ra * rb + rb * rb) / 3 * (zb - za)
+        area += pi * (ra + rb) * np.hypot(rb - ra, zb - za)
+    return volume, area
+
+def partEstimate(part, args, diameter=FILAMENT_DIAMETER, density=FILAMENT_DENSITY, flow=PRINT_FLOW):
+    # What printing a part solid takes, without making it: its volume in
+    # cm³, surface area in cm², grams and metres of filament, and minutes at
+    # a steady flow. Slicers add travel, infill patterns and supports, so
+    # take the time as a lower bound.
+    volume, area = partMeasure(part, args)
+    return volume / 1000, area / 100, volume / 1000 * density, volume / (pi * diameter * diameter / 4) / 1000, volume / flow / 60
+
+def enclosingCircle(points):
+    # Centre and radius of the smallest circle around 2D points: Welzl's
+    # method, incremental form, on their convex hull.
+    points = sorted(set(map(tuple, np.asarray(points, dtype=np.float64).tolist())))
+    def turn(a, b, c):
+        return (b[0] - a[0]) * (c[1] - a[1]) - (b[1] - a[1]) * (c[0] - a[0])
+    hull = []
+    for chain in (points, points[::-1]):
+        half = []
+        for point in chain:
+            while len(half) >= 2 and turn(half[-2], half[-1], point) <= 0:
+                half.pop()
+            half.append(point)
+        hull += half[:-1]
+    hull = np.array(hull or points)[np.random.RandomState(0).permutation(len(hull or points))]
+
+    def circle(*edge):
+        if len(edge) == 2:
+            centre = (edge[0] + edge[1]) / 2
+        else:
+            a, b, c = edge
+            d = 2 * turn(a, b, c)
+            if d == 0:
+                return max((circle(p, q) for p, q in ((a, b), (b, c), (a, c))), key=lambda found: found[1])
+            centre = np.array([np.dot(a, a) * (b[1] - c[1]) + np.dot(b, b) * (c[1] - a[1]) + np.dot(c, c) * (a[1] - b[1]),
+                               np.dot(a, a) * (c[0] - b[0]) + np.dot(b, b) * (a[0] - c[0]) + np.dot(c, c) * (b[0] - a[0])]) / d
+        return centre, np.hypot(*(edge[0] - centre))
+    def outside(point, found):
+        return np.hypot(*(point - found[0])) > found[1] * (1 + 1e-12)
+    found = hull[0], 0.0
+    for i in range(1, len(hull)):
+        if outside(hull[i], found):
+            found = hull[i], 0.0
+            for j in range(i):
+                if outside(hull[j], found):
+                    found = circle(hull[i], hull[j])
+                    for k in range(j):
+                        if outside(hull[k], found):
+                            found = circle(hull[i], hull[j], hull[k])
+    return found[0], found[1]
+
+def chassisProfile(corners, step=0.25, flip=False):
+    # How far something that slides down inside a part, like the chassis of
+    # the electronics, reaches out from its axis in every step mm of its
+    # length. It lies along the longest side of its bounding box, and its
+    # axis is the centre of the smallest circle around it seen end on, which
+    # is the axis it slides down the part on. Triangles are cut at the band
+    # boundaries, so long ones count in every band they cross. Returns the
+    # reach of every band from the bottom end, or with flip from the top.
+    corners = np.asarray(corners, dtype=np.float64)
+    axis = np.argmax(np.ptp(corners.reshape(-1, 3), axis=0))
+    along = corners[..., axis]
+    along = along.max() - along if flip else along - along.min()
+    across = np.delete(corners, axis, axis=2)
+    centre, radius = enclosingCircle(across.reshape(-1, 2))
+    across -= centre
+    bands = max(1, int(np.ceil(along.max() / step)))
+    reach = np.zeros(bands)
+    np.maximum.at(reach, np.minimum(along // step, bands - 1).astype(np.intp).ravel(), np.hypot(across[..., 0], across[..., 1]).ravel())
+
+    # Every edge of every triangle where it crosses each band boundary.
+    start, end = along.ravel(), np.roll(along, -1, axis=1).ravel()
+    a, b = across.reshape(-1, 2), np.roll(across, -1, axis=1).reshape(-1, 2)
+    first = np.floor(np.minimum(start, end) / step).astype(np.intp) + 1
+    count = np.maximum(np.ceil(np.maximum(start, end) / step).astype(np.intp) - first, 0)
+    edge = np.repeat(np.arange(len(start)), count)
+    boundary = first[edge] + np.arange(len(edge)) - np.repeat(np.cumsum(count) - count, count)
+    t = (boundary * step - start[edge]) / (end[edge] - start[edge])
+    crossing = a[edge] + t[:, None] * (b[edge] - a[edge])
+    crossing = np.hypot(crossing[:, 0], crossing[:, 1])
+    np.maximum.at(reach, boundary - 1, crossing)
+    np.maximum.at(reach, np.minimum(boundary, bands - 1), crossing)
+    return reach
+
+def partBore(part, args, z):
+    # Radius of the hole through a part at the heights z, from its outline,
+    # with female threads at their crests. inf above and below the part.
+    VerticesPerLoop, h1, h2, h3, h4, outline, chordError, envelopes = partOutline(part, args)
+    path = np.array([point for pair in outlineEnds(h1, h2, h3, h4, outline) for point in pair], dtype=np.float64)
+    a, b = path, np.roll(path, -1, axis=0)
+    z = np.asarray(z, dtype=np.float64)[..., None]
+    rise = b[:, 1] - a[:, 1]
+    t = np.divide(z - a[:, 1], rise, out=np.zeros(z.shape[:-1] + rise.shape), where=rise != 0)
+    radius = np.where(rise != 0, a[:, 0] + t * (b[:, 0] - a[:, 0]), np.minimum(a[:, 0], b[:, 0]))
+    return np.where((z >= np.minimum(a[:, 1], b[:, 1])) & (z <= np.maximum(a[:, 1], b[:, 1])), radius, np.inf).min(axis=-1)
+
+# Least gap in mm chassisFit wants between a chassis and the part around it.
+MIN_CLEARANCE = 0.2
+
+def chassisFit(corners, part='hilt', args=None, step=0.25, flip=False, minClearance=MIN_CLEARANCE):
+    # Drop a chassis, the triangle corners of an STL file, down the hole
+    # through a part from the top, bottom end first (top end first with
+    # flip), and see where it stops. Returns the height of its bottom end
+    # there, how far its top end sticks out of the part, the smallest gap
+    # around it away from where it rests, and a list of the problems found.
+    args = DEFAULTS[part] if args is None else args
+    reach = chassisProfile(corners, step, flip)
+    VerticesPerLoop, h1, h2, h3, h4, outline, chordError, envelopes = partOutline(part, args)
+    heights = [z for pair in outlineEnds(h1, h2, h3, h4, outline) for r, z in pair]
+    bottom, top = min(heights), max(heights)
+
+    # The narrowest the hole gets in every band, from the ends of the band
+    # and the corners of the outline within it. The bands go from below the
+    # part to where the whole chassis is still above it.
+    low = bottom - len(reach) * step - step
+    levels = low + np.arange(int(np.ceil((top - low) / step)) + len(reach) + 2) * step
+    bore = np.minimum(partBore(part, args, levels[:-1]), partBore(part, args, levels[1:]))
+    inside = (np.array(heights) - low) // step
+    np.minimum.at(bore, inside.astype(np.intp), partBore(part, args, heights))
+
+    # It can only get down to where it fits and fits all the way above.
+    fits = np.ones(len(bore) - len(reach) + 1, dtype=bool)
+    for i, radius in enumerate(reach):
+        fits &= bore[i:i + len(fits)] >= radius
+    rest = len(fits) - np.argmin(fits[::-1]) if not fits.all() else 0
+    problems = []
+    if rest == 0:
+        problems.append('the chassis falls straight through the %s' % PARTS[part][0])
+        return np.nan, np.nan, np.nan, problems
+    stop = low + rest * step
+    if stop >= top:
+        problems.append('the chassis does not fit into the top of the %s' % PARTS[part][0])
+        return stop, stop + len(reach) * step - top, np.nan, problems
+
+    # What it rests on, and the room left everywhere else.
+    caught = np.flatnonzero(bore[rest - 1:rest - 1 + len(reach)] < reach)[-1]
+    gap = bore[rest:rest + len(reach)] - reach
+    away = np.abs(np.arange(len(reach)) - caught) * step >= 3
+    clearance = gap[away].min() if away.any() else np.nan
+    if caught * step >= 3:
+        problems.append('the chassis catches %.1f mm up from its end, at z %.2f, before it is down' % (caught * step, stop + caught * step))
+    if clearance < minClearance:
+        tight = np.flatnonzero(away & (gap < minClearance))
+        problems.append('only %.2f mm around the chassis at z %.2f-%.2f' % (clearance, stop + tight[0] * step, stop + (tight[-1] + 1) * step))
+    return stop, stop + len(reach) * step - top, clearance, problems
+
+def buildPart(part, args):
+    with stage('build', part) as record:
+        mesh = PARTS[part][1](*args)
+        record['verts'] = len(mesh.verts)
+        record['faces'] = len(mesh.faces)
+    return mesh
+
+def writePart(part, args, filename, stream=False):
+    # Returns the number of triangles written and what validateMesh found.
+    # With stream the part is written a chunk at a time by streamOutline
+    # instead, in bounded memory but without the validateMesh check.
+    if stream:
+        with stage('export', part):
+            return writeSTL(filename, streamOutline(*partOutline(part, args)), PARTS[part][0]), []
+    mesh = buildPart(part, args)
+    with stage('validate', part):
+        problems = validateMesh(mesh)
+    with stage('export', part):
+        return writeSTL(filename, mesh, PARTS[part][0]), problems
+
+def workerModule():
+    # Worker processes look up their function by module name, and a script run
+    # from Blender's text editor or as __main__ doesn't have a usable one, so
+    # load this file again as a plain module. From the text editor __file__
+    # is the .blend file joined with the name of the text, so the file comes
+    # from the text instead. Returns None if there is no file to load, or it
+    # isn't the code that is running; everything is then made in this
+    # process.
+    if __name__ != '__main__':
+        return sys.modules[__name__]
+    path = os.path.abspath(__file__)
+    if not os.path.isfile(path) and 'bpy' in sys.modules:
+        import bpy
+        text = bpy.data.texts.get(os.path.basename(path))
+        if text is None or not text.filepath or text.is_dirty or text.is_modified:
+            return None
+        path = bpy.path.abspath(text.filepath)
+    folder, filename = os.path.split(path)
+    if folder not in sys.path:
+        sys.path.append(folder)
+    try:
+        return importlib.import_module(os.path.splitext(filename)[0])
+    except ImportError:
+        return None
+
+def runInWorkers(function, jobs, processes=None):
+    # Call function(*job) for every job, each in a worker process, and return
+    # the results in the same order.
+    jobs = list(jobs)
+    # A StageLog only sees this process, so record everything here.
+    module = None
+    if processes != 1 and len(jobs) > 1 and stageLog is None:
+        module = workerModule()
+    if module is None:
+        return [function(*job) for job in jobs]
+    function = getattr(module, function.__name__)
+    with workerPool(processes or min(len(jobs), os.cpu_count())) as pool:
+        return list(pool.map(function, *zip(*jobs)))
+
+@contextmanager
+def workerPool(processes):
+    # The worker processes of runInWorkers.
+    with ProcessPoolExecutor(processes, mp_context=workerContext()) as pool, workerMain():
+        yield pool
+
+@contextmanager
+def workerMain():
+    # A new worker first runs the file of __main__ again, and from Blender's
+    # text editor there is no such file, so while workers may be starting
+    # __main__ is a blank module instead.
+    main = sys.modules['__main__']
+    if getattr(main, '__file__', None) is not None and not os.path.isfile(main.__file__):
+        sys.modules['__main__'] = types.ModuleType('__main__')
+    try:
+        yield
+    finally:
+        sys.modules['__main__'] = main
+
+def workerContext():
+    # How workerPool starts its workers.
+    context = multiprocessing.get_context('spawn')
+    if 'bpy' in sys.modules:
+        # Before 2.91 sys.executable is Blender itself, not its Python.
+        import bpy
+        context.set_executable(getattr(bpy.app, 'binary_path_python', sys.executable))
+    return context
+
+# Bump whenever a change to the builders changes the geometry they make or
+# what is stored with it, so the cache doesn't hand out parts made by the old
+# code.
+GENERATOR_VERSION = 3
+
+class PartCache:
+    # Finished parts on disk, one folder of .npy files per part, named by a
+    # hash of the builder, its parameters and GENERATOR_VERSION. Hits are
+    # memory mapped rather than read, and once the cache grows past maxBytes
+    # the parts used longest ago are deleted.
+    def __init__(self, folder=None, maxBytes=1 << 30):
+        self.folder = folder or os.environ.get('LIGHTSABER_CACHE') or os.path.join(os.path.expanduser('~'), '.cache', 'LightSaberMaker')
+        self.maxBytes = maxBytes
+
+    def entry(self, part, args):
+        build = PARTS[part][1]
+        bound = inspect.signature(build).bind(*args)
+        bound.apply_defaults()
+        values = [value if value is None or isinstance(value, bool) else float(value) for value in bound.arguments.values()]
+        key = repr((GENERATOR_VERSION, build.__name__, values))
+        return os.path.join(self.folder, hashlib.sha256(key.encode()).hexdigest())
+
+    def load(self, part, args):
+        entry = self.entry(part, args)
+        try:
+            verts = np.load(os.path.join(entry, 'verts.npy'), mmap_mode='r')
+            faces = np.load(os.path.join(entry, 'faces.npy'), mmap_mode='r')
+            packed = np.load(os.path.join(entry, 'ngons.npy'))
+            with open(os.path.join(entry, 'sections.json')) as f:
+                sections = [tuple(section) for section in json.load(f)]
+            # Every ngon is stored as its face number, its size and its corners.
+            ngons = {}
+            i = 0
+            while i < len(packed):
+                ngons[int(packed[i])] = packed[i + 2:i + 2 + packed[i + 1]].tolist()
+                i += 2 + packed[i + 1]
+            os.utime(entry)
+        except OSError:
+            # Not there, or evicted by another run while being read.
+            return None
+        except ValueError:
+            # A damaged entry; it is made again and stored afresh.
+            shutil.rmtree(entry, ignore_errors=True)
+            return None
+        mesh = MeshBuffer.__new__(MeshBuffer)
+        mesh.__setstate__((verts, faces, ngons, sections))
+        return mesh
+
+    def store(self, part, args, mesh):
+        entry = self.entry(part, args)
+        os.makedirs(self.folder, exist_ok=True)
+        # Write into a private folder and rename it into place, so another
+        # run never sees half a part.
+        temp = '%s.%d' % (entry, os.getpid())
+        os.makedirs(temp, exist_ok=True)
+        np.save(os.path.join(temp, 'verts.npy'), mesh.verts)
+        np.save(os.path.join(temp, 'faces.npy'), mesh.faces)
+        packed = [[face, len(ngon)] + list(ngon) for face, ngon in mesh.ngons.items()]
+        np.save(os.path.join(temp, 'ngons.npy'), np.array(sum(packed, []), dtype=np.int32))
+        with open(os.path.join(temp, 'sections.json'), 'w') as f:
+            json.dump(mesh.sections, f)
+        try:
+            os.rename(temp, entry)
+        except OSError:
+            shutil.rmtree(temp, ignore_errors=True)
+        self.evict()
+
+    def evict(self):
+        entries = []
+        for name in os.listdir(self.folder):
+            path = os.path.join(self.folder, name)
+            if len(name) == 64 and os.path.isdir(path):
+                size = sum(entry.stat().st_size for entry in os.scandir(path))
+                entries.append((os.stat(path).st_mtime, size, path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.maxBytes:
+                break
+            # A part that is still mapped can't be deleted on Windows.
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
+
+def buildParts(jobs, processes=None, cache=None):
+    # Build a list of (part, args) jobs in parallel and return their meshes
+    # in the same order. The parts don't depend on each other, so the whole
+    # kit takes about as long as its largest part. With a PartCache only the
+    # parts it doesn't have yet are built. Identical jobs are built once and
+    # get the same MeshBuffer.
+    keys = [json.dumps([part, list(args)]) for part, args in jobs]
+    unique = dict(zip(keys, jobs))
+    meshes = [cache.load(part, args) if cache else None for part, args in unique.values()]
+    missing = [i for i, mesh in enumerate(meshes) if mesh is None]
+    # A single part is made here, with its threads split between the cores.
+    with threadWorkers(processes) if len(missing) == 1 else nullcontext():
+        built = runInWorkers(buildPart, [list(unique.values())[i] for i in missing], processes)
+    for i, mesh in zip(missing, built):
+        if cache:
+            cache.store(*list(unique.values())[i], mesh)
+        meshes[i] = mesh
+    meshes = dict(zip(unique, meshes))
+    return [meshes[key] for key in keys]
+
+# Coarsest chord error in mm the preview uses.
+PREVIEW_CHORD_ERROR = 0.25
+
+def previewJob(part, args, preview):
+    # What to build instead of a job to preview it: with preview=True the
+    # same part at no finer than PREVIEW_CHORD_ERROR, and with
+    # preview='envelopes' also with plain cylinders for its threads.
+    if not preview:
+        return part, args
+    bound = inspect.signature(PARTS[part][1]).bind(*args)
+    bound.apply_defaults()
+    bound.arguments['chordError'] = max(bound.arguments['chordError'] or 0, PREVIEW_CHORD_ERROR)
+    if preview == 'envelopes':
+        bound.arguments['envelopes'] = True
+    return part, bound.args
+
+def createParts(jobs, processes=None, cache=None, preview=False, bed=None):
+    # Same as calling the create* function of every job in turn, but only
+    # the Blender ingest at the end is done one part after another. Every
+    # object remembers its job, so exportParts can make it at full
+    # resolution whatever it was previewed at. Objects with the same job
+    # share one mesh datablock, so a class set of 30 identical hilts costs
+    # no more than one. With bed, a (width, depth) in mm, the objects are
+    # laid out on print beds of that size by arrangeOnBed.
+    import bpy
+    jobs = list(jobs)
+    if preview and processes is None:
+        # Coarse parts build faster than worker processes start.
+        processes = 1
+
+    # Running again reuses the objects made last time instead of adding
+    # Hilt.001 and so on, and leaves alone the ones whose job is the same.
+    objects = []
+    for part, args in jobs:
+        objects.append(next((ob for ob in bpy.data.objects if ob.get('LightSaberPart') == part and ob not in objects), None))
+    recipes = [json.dumps([part, list(args)]) for part, args in jobs]
+    changed = [i for i, ob in enumerate(objects) if ob is None or ob.get('LightSaberMaker') != recipes[i] or ob.get('LightSaberPreview') != json.dumps(preview)]
+
+    # The mesh datablock of every job already in the file, to share.
+    shared = {}
+    for ob in bpy.data.objects:
+        if 'LightSaberMaker' in ob and not any(ob is objects[i] for i in changed):
+            shared.setdefault((ob['LightSaberMaker'], ob.get('LightSaberPreview')), ob.data)
+
+    # Only the first of each job not in the file yet needs building, the
+    # rest take its mesh from shared as they are ingested.
+    keys = {i: (recipes[i], json.dumps(preview)) for i in changed}
+    build = {}
+    for i in changed:
+        if keys[i] not in shared:
+            build.setdefault(keys[i], i)
+    meshes = dict(zip(build.values(), buildParts([previewJob(*jobs[i], preview) for i in build.values()], processes, cache)))
+    for i in changed:
+        part = jobs[i][0]
+        key = keys[i]
+        mesh = meshes.get(i)
+        with stage('ingest', part):
+            if key in shared and objects[i] is None:
+                objects[i] = createObject(PARTS[part][0], [0, 0, 0], shared[key])
+            elif key in shared:
+                me = objects[i].data
+                objects[i].data = shared[key]
+                if me.users == 0:
+                    bpy.data.meshes.remove(me)
+            elif objects[i] is None:
+                objects[i] = createMeshFromData(PARTS[part][0], [0, 0, 0], mesh)
+            else:
+                replaceMeshData(objects[i], mesh)
+        shared[key] = objects[i].data
+        objects[i]['LightSaberPart'] = part
+        objects[i]['LightSaberMaker'] = recipes[i]
+        objects[i]['LightSaberPreview'] = json.dumps(preview)
+    if bed:
+        arrangeOnBed(objects, *bed)
+    return objects
+
+def arrangeOnBed(objects, width=220, depth=220, gap=5):
+    # Stand the objects on z = 0 in rows on print beds width by depth mm,
+    # gap mm apart, in the order given. Every part gets a square as wide as
+    # the widest of them. When a bed is full the next one starts to its
+    # right, one square further on.
+    footprints = {}
+    for ob in objects:
+        if ob.data.name not in footprints:
+            verts = np.empty(len(ob.data.vertices) * 3, dtype=np.float32)
+            ob.data.vertices.foreach_get('co', verts)
+            verts = verts.reshape(-1, 3)
+            footprints[ob.data.name] = (np.hypot(verts[:, 0], verts[:, 1]).max(), verts[:, 2].min())
+    cell = 2 * max(radius for radius, bottom in footprints.values()) + gap
+    columns = max(1, int((width + gap) // cell))
+    rows = max(1, int((depth + gap) // cell))
+    for i, ob in enumerate(objects):
+        bed, place = divmod(i, columns * rows)
+        row, column = divmod(place, columns)
+        radius, bottom = footprints[ob.data.name]
+        ob.location = (bed * (width + cell) + (column + 0.5) * cell - gap / 2, (row + 0.5) * cell - gap / 2, -bottom)
+
+def removePart(part):
+    # Delete a part's object and its mesh datablock.
+    import bpy
+    for ob in [ob for ob in bpy.data.objects if ob.get('LightSaberPart') == part]:
+        me = ob.data
+        bpy.data.objects.remove(ob)
+        if me.users == 0:
+            bpy.data.meshes.remove(me)
+
+def exportParts(folder, processes=None, cache=None):
+    # Write every part in the Blender file to <object name>.stl in folder,
+    # built again from its job at full resolution. Each part is checked by
+    # validateMesh first; the problems are printed and returned.
+    import bpy
+    objects = [ob for ob in bpy.data.objects if 'LightSaberMaker' in ob]
+    jobs = [tuple(json.loads(ob['LightSaberMaker'])) for ob in objects]
+    folder = bpy.path.abspath(folder)
+    os.makedirs(folder, exist_ok=True)
+    problems = []
+    found = {}
+    for ob, mesh in zip(objects, buildParts(jobs, processes, cache)):
+        # Copies of a part share its MeshBuffer, and are only checked once.
+        if id(mesh) not in found:
+            with stage('validate', ob['LightSaberPart']):
+                found[id(mesh)] = validateMesh(mesh)
+        problems += ['%s: %s' % (ob.name, problem) for problem in found[id(mesh)]]
+        writeSTL(os.path.join(folder, ob.name + '.stl'), mesh, ob.name)
+    for problem in problems:
+        print('Warning: ' + problem)
+    return problems
+
+def addonClasses():
+    # The add-on keeps one group of settings per part on the scene. Changing
+    # a setting remakes only that part, in place; changing the preview
+    # remakes them all.
+    import bpy
+    from bpy.props import BoolProperty, EnumProperty, FloatProperty, IntProperty, PointerProperty, StringProperty
+
+    def settingsArgs(scene, part):
+        settings = getattr(scene.lightsaber, part)
+        # A chordError of 0 stands for none.
+        return [(getattr(settings, name) or None) if name == 'chordError' else getattr(settings, name)
+                for name in inspect.signature(PARTS[part][1]).parameters]
+
+    def updatePart(scene, part, cache=None):
+        # Only Make Parts passes a cache. Dragging a slider would otherwise
+        # store a part on disk for every value it passes through.
+        if getattr(scene.lightsaber, part).enabled:
+            preview = {'FULL': False, 'COARSE': True, 'ENVELOPES': 'envelopes'}[scene.lightsaber.preview]
+            createParts([(part, settingsArgs(scene, part))], cache=None if preview else cache, preview=preview)
+        else:
+            removePart(part)
+
+    def partSettings(part):
+        update = lambda self, context: updatePart(context.scene, part)
+        annotations = {'enabled': BoolProperty(name='Make', default=part in ('bladeholder', 'hilt', 'pommel'), update=update)}
+        signature = inspect.signature(PARTS[part][1])
+        bound = signature.bind(*DEFAULTS[part])
+        bound.apply_defaults()
+        for name, value in bound.arguments.items():
+            param = signature.parameters[name]
+            if isinstance(value, bool):
+                annotations[name] = BoolProperty(name=name, default=value, update=update)
+            elif paramType(param) is int:
+                annotations[name] = IntProperty(name=name, default=value, min=3 if name == 'VerticesPerLoop' else 1, update=update)
+            else:
+                annotations[name] = FloatProperty(name=name, default=float(value or 0), min=0, precision=2, step=1, update=update)
+        return type('LightSaber%sSettings' % PARTS[part][0], (bpy.types.PropertyGroup,), {'__annotations__': annotations})
+
+    parts = [partSettings(part) for part in PARTS]
+
+    def updateAll(self, context):
+        for part in PARTS:
+            updatePart(context.scene, part)
+
+    annotations = {part: PointerProperty(type=settings) for part, settings in zip(PARTS, parts)}
+    annotations['preview'] = EnumProperty(name='Preview', update=updateAll, items=[
+        ('FULL', 'Full', 'Make the parts at full resolution'),
+        ('COARSE', 'Coarse', 'Make the parts coarsely, for a quick look'),
+        ('ENVELOPES', 'No threads', 'Make the parts coarsely, with plain cylinders for the threads')])
+    annotations['folder'] = StringProperty(name='Folder', default='//', subtype='DIR_PATH')
+    LightSaberSettings = type('LightSaberSettings', (bpy.types.PropertyGroup,), {'__annotations__': annotations})
+
+    class LIGHTSABER_OT_make(bpy.types.Operator):
+        bl_idname = 'lightsaber.make'
+        bl_label = 'Make Parts'
+        bl_description = 'Make or update every part ticked below'
+        bl_options = {'REGISTER', 'UNDO'}
+
+        def execute(self, context):
+            cache = PartCache()
+            for part in PARTS:
+                updatePart(context.scene, part, cache)
+            return {'FINISHED'}
+
+    class LIGHTSABER_OT_export(bpy.types.Operator):
+        bl_idname = 'lightsaber.export'
+        bl_label = 'Export STL'
+        bl_description = 'Write every part to an STL file in the folder, at full resolution'
+
+        def execute(self, context):
+            problems = exportParts(context.scene.lightsaber.folder, cache=PartCache())
+            if problems:
+                self.report({'WARNING'}, '%s (%d problems, see the system console)' % (problems[0], len(problems)))
+            return {'FINISHED'}
+
+    class LIGHTSABER_PT_parts(bpy.types.Panel):
+        bl_label = 'LightSaber Maker'
+        bl_space_type = 'VIEW_3D'
+        bl_region_type = 'UI'
+        bl_category = 'LightSaber'
+
+        def draw(self, context):
+            settings = context.scene.lightsaber
+            self.layout.prop(settings, 'preview')
+            self.layout.operator('lightsaber.make')
+            for part, (name, build) in PARTS.items():
+                box = self.layout.box()
+                box.prop(getattr(settings, part), 'enabled', text=name)
+                if getattr(settings, part).enabled:
+                    for param in inspect.signature(build).parameters:
+                        box.prop(getattr(settings, part), param)
+            self.layout.prop(settings, 'folder')
+            self.layout.operator('lightsaber.export')
+
+    return parts + [LightSaberSettings, LIGHTSABER_OT_make, LIGHTSABER_OT_export, LIGHTSABER_PT_parts]
+
+addonRegistered = []
+
+def register():
+    import bpy
+    addonRegistered[:] = addonClasses()
+    for cls in addonRegistered:
+        bpy.utils.register_class(cls)
+    bpy.types.Scene.lightsaber = bpy.props.PointerProperty(type=addonRegistered[len(PARTS)])
+
+def unregister():
+    import bpy
+    del bpy.types.Scene.lightsaber
+    for cls in reversed(addonRegistered):
+        bpy.utils.unregister_class(cls)
+    addonRegistered[:] = []
+
+def paramType(param):
+    # How a command line or CSV value becomes a parameter of a build function.
+    if isinstance(param.default, bool):
+        return lambda value: value.strip().lower() in ('1', 'true', 'yes')
+    if param.name == 'VerticesPerLoop' or param.name.startswith('num'):
+        return int
+    return float
+
+def sweepVariants(args, vary):
+    # Every combination of the values in vary, a dict of parameter name to
+    # list of values, on top of the args dict.
+    return [dict(args, **dict(zip(vary, values))) for values in itertools.product(*vary.values())]
+
+def readOrders(filename):
+    # One (part, args, label, copies) variant per row of a CSV file with a
+    # part column and a column for each parameter of the part. Empty cells
+    # leave an optional parameter at its default, a label column, if there is
+    # one, names the files and a copies column says how many of the row are
+    # wanted. Other columns are ignored, so a manifest written by sweep can be
+    # read back as orders.
+    variants = []
+    with open(filename, newline='') as f:
+        for line, row in enumerate(csv.DictReader(f), 2):
+            part = (row.get('part') or '').strip()
+            if part not in PARTS:
+                raise ValueError('line %d: unknown part %r' % (line, part))
+            signature = inspect.signature(PARTS[part][1])
+            args = {name: paramType(signature.parameters[name])(value) for name, value in row.items() if name in signature.parameters and value.strip()}
+            try:
+                signature.bind(**args)
+            except TypeError as error:
+                raise ValueError('line %d: %s' % (line, error))
+            try:
+                copies = int((row.get('copies') or '').strip() or 1)
+            except ValueError:
+                copies = 0
+            if copies < 1:
+                raise ValueError('line %d: copies must be a whole number of at least 1, not %r' % (line, row['copies']))
+            variants.append((part, args, (row.get('label') or '').strip() or None, copies))
+    return variants
+
+def namedJobs(orders):
+    # (label, part, args) jobs for a part name, meaning the part as shipped,
+    # or for every order in a CSV file of orders.
+    if orders in PARTS:
+        return [(PARTS[orders][0], orders, DEFAULTS[orders])]
+    return [(label or '%s %d' % (PARTS[part][0], i + 1), part, inspect.signature(PARTS[part][1]).bind(**args).args)
+            for i, (part, args, label, copies) in enumerate(readOrders(orders))]
+
+def sweep(variants, outdir='.', processes=None, stream=False):
+    # Write every (part, args, label, copies) variant to its own STL file in
+    # outdir, building them in parallel, and list them in outdir/manifest.csv.
+    # Identical parameter sets are built once, with copies adding up how many
+    # of them were asked for.
+    unique = {}
+    for part, args, label, copies in variants:
+        bound = inspect.signature(PARTS[part][1]).bind(**args)
+        bound.apply_defaults()
+        key = (part, tuple(bound.arguments.values()))
+        if key in unique:
+            unique[key]['copies'] += copies
+        else:
+            unique[key] = dict(bound.arguments, part=part, label=label, copies=copies)
+    rows = list(unique.values())
+
+    # Unlabelled variants are named after the parameters that tell them
+    # apart from the other variants of the same part.
+    names = set()
+    for row in rows:
+        build = PARTS[row['part']][1]
+        if not row['label']:
+            params = inspect.signature(build).parameters
+            varying = [name for name in params if len({other[name] for other in rows if other['part'] == row['part']}) > 1]
+            row['label'] = PARTS[row['part']][0] + ''.join('_%s%s' % (name, '%g' % row[name] if row[name] is not None else '') for name in varying)
+        label = re.sub(r'[^\w.=-]+', '_', row['label'])
+        filename = label + '.stl'
+        copy = 1
+        while filename in names:
+            copy += 1
+            filename = '%s_%d.stl' % (label, copy)
+        names.add(filename)
+        row['file'] = filename
+
+    os.makedirs(outdir, exist_ok=True)
+    jobs = [(row['part'], [row[name] for name in inspect.signature(PARTS[row['part']][1]).parameters], os.path.join(outdir, row['file']), stream) for row in rows]
+    for row, job, (triangles, problems) in zip(rows, jobs, runInWorkers(writePart, jobs, processes)):
+        row['triangles'] = triangles
+        volume, area, grams, metres, minutes = partEstimate(*job[:2])
+        row['grams'] = '%.1f' % grams
+        row['minutes'] = '%.0f' % minutes
+        row['problems'] = '; '.join(problems)
+        for problem in problems:
+            print('Warning: %s: %s' % (row['file'], problem))
+
+    columns = ['file', 'label', 'part', 'copies', 'triangles', 'grams', 'minutes', 'problems']
+    for part in dict.fromkeys(row['part'] for row in rows):
+        columns += [name for name in inspect.signature(PARTS[part][1]).parameters if name not in columns]
+    manifest = os.path.join(outdir, 'manifest.csv')
+    with open(manifest, 'w', newline='') as f:
+        writer = csv.DictWriter(f, columns)
+        writer.writeheader()
+        writer.writerows(rows)
+    return manifest, rows
+
+def main(argv=None):
+    # Outside Blender: make one part from the same parameters the create*
+    # calls below take, e.g.
+    #   python LightSaberMaker.py hilt 256 3 5 19.5 18.2 0.8 0.2 0.8 0.3 0.5 2 2
+    # or a family of fit-test variants of it,
+    #   python LightSaberMaker.py hilt 256 3 5 19.5 18.2 0.8 0.2 0.8 0.3 0.5 2 2 --vary radiiDiff=0.4,0.5,0.6 -d fit
+    # or everything listed in a CSV file of orders,
+    #   python LightSaberMaker.py sweep orders.csv -d fit
+    # or how well the threads of two parts fit, without making either,
+    #   python LightSaberMaker.py fit hilts.csv pommel
+    # or how much filament and time parts take, also without making them,
+    #   python LightSaberMaker.py estimate orders.csv
+    # or whether the electronics chassis slides down the hilt,
+    #   python LightSaberMaker.py chassis BatteryChassis6PrintReady2-Cylinder_004.stl hilt
+    parser = argparse.ArgumentParser(description='Write lightsaber parts as binary STL files (1 unit = 1 mm).')
+    subparsers = parser.add_subparsers(dest='part', required=True)
+    sweepOptions = argparse.ArgumentParser(add_help=False)
+    sweepOptions.add_argument('-d', '--outdir', default='.', help='folder for the variants and their manifest.csv (default: current folder)')
+    sweepOptions.add_argument('-j', '--jobs', type=int, help='worker processes (default: one per CPU when making several parts, one when making a single part)')
+    sweepOptions.add_argument('--stages', nargs='?', const='-', metavar='FILE',
+                              help='time every stage of making the parts and print a table, or write JSON to FILE')
+    sweepOptions.add_argument('--stream', action='store_true',
+                              help='write the parts a chunk at a time, for parts too big to fit in memory; skips the checks')
+    for part, (name, build) in PARTS.items():
+        sub = subparsers.add_parser(part, help='make the ' + name, parents=[sweepOptions])
+        for param in inspect.signature(build).parameters.values():
+            if isinstance(param.default, bool):
+                sub.add_argument('--' + param.name, action='store_true')
+            elif param.default is not param.empty:
+                sub.add_argument('--' + param.name, type=paramType(param), default=param.default, help='(default: %(default)s)')
+            else:
+                sub.add_argument(param.name, type=paramType(param))
+        sub.add_argument('-o', '--output', help='STL file to write (default: <part name>.stl)')
+        sub.add_argument('--vary', action='append', default=[], metavar='NAME=VALUES',
+                         help='make a variant for each comma separated value of a parameter; give several for every combination')
+    sub = subparsers.add_parser('sweep', help='make every variant listed in a CSV file', parents=[sweepOptions])
+    sub.add_argument('orders', help='CSV file with a part column, a column for each parameter and an optional label column')
+    sub = subparsers.add_parser('fit', help='check how the male threads of parts screw into the female threads of others')
+    sub.add_argument('male', help='a part name for the part as shipped, or a CSV file of orders like sweep takes')
+    sub.add_argument('female', help='the same for the parts with the female threads')
+    sub.add_argument('-o', '--output', help='CSV file for the results (default: print a table)')
+    sub = subparsers.add_parser('estimate', help='estimate the filament and print time of parts from their parameters')
+    sub.add_argument('orders', help='a part name for the part as shipped, or a CSV file of orders like sweep takes')
+    sub.add_argument('--diameter', type=float, default=FILAMENT_DIAMETER, help='filament diameter in mm (default: %(default)s)')
+    sub.add_argument('--density', type=float, default=FILAMENT_DENSITY, help='filament density in g/cm³ (default: %(default)s, PLA)')
+    sub.add_argument('--flow', type=float, default=PRINT_FLOW, help='printing flow in mm³/s (default: %(default)s)')
+    sub.add_argument('-o', '--output', help='CSV file for the results (default: print a table)')
+    sub = subparsers.add_parser('chassis', help='check that a chassis STL file slides down the hole through parts')
+    sub.add_argument('stl', help='binary STL file of the chassis')
+    sub.add_argument('orders', nargs='?', default='hilt', help='a part name for the part as shipped, or a CSV file of orders like sweep takes (default: %(default)s)')
+    sub.add_argument('--flip', action='store_true', help='put the chassis in the other way up')
+    sub.add_argument('-o', '--output', help='CSV file for the results (default: print a table)')
+    options = vars(parser.parse_args(argv))
+    part = options.pop('part')
+    if part in ('fit', 'estimate', 'chassis'):
+        sides = []
+        for orders in [options[name] for name in ('male', 'female', 'orders') if name in options]:
+            try:
+                sides.append(namedJobs(orders))
+            except (OSError, ValueError) as error:
+                parser.error('%s: %s' % (orders, error))
+        if part == 'fit':
+            results = fitParts(*[[job[1:] for job in side] for side in sides])
+            rows = [[male[0], female[0]] + ['%.3f' % result[i, j] for result in results]
+                    for i, male in enumerate(sides[0]) for j, female in enumerate(sides[1])]
+            header = ['male', 'female', 'clearance', 'play', 'engaged']
+            line = '%-24s %-24s %10s %8s %8s'
+        elif part == 'estimate':
+            rows = [[label, name] + ['%.1f' % value for value in partEstimate(name, args, options['diameter'], options['density'], options['flow'])]
+                    for label, name, args in sides[0]]
+            header = ['label', 'part', 'cm3', 'cm2', 'grams', 'metres', 'minutes']
+            line = '%-24s %-12s %8s %8s %8s %8s %8s'
+        else:
+            try:
+                corners = readSTL(options['stl'])
+            except (OSError, ValueError) as error:
+                parser.error(str(error))
+            rows = []
+            for label, name, args in sides[0]:
+                stop, out, clearance, problems = chassisFit(corners, name, args, flip=options['flip'])
+                rows.append([label, name, '%.2f' % stop, '%.2f' % out, '%.2f' % clearance, '; '.join(problems)])
+                for problem in problems:
+                    print('Warning: %s: %s' % (label, problem))
+            header = ['label', 'part', 'stop', 'out', 'clearance', 'problems']
+            line = '%-24s %-12s %8s %8s %9s  %s'
+        if options['output']:
+            with open(options['output'], 'w', newline='') as f:
+                writer = csv.writer(f)
+                writer.writerow(header)
+                writer.writerows(rows)
+            print('Wrote %d rows to %s' % (len(rows), options['output']))
+        else:
+            for row in [header] + rows:
+                print(line % tuple(row))
+        return
+    outdir = options.pop('outdir')
+    processes = options.pop('jobs')
+    stages = options.pop('stages')
+    stream = options.pop('stream')
+    if stages:
+        startStageLog()
+    if part == 'sweep':
+        try:
+            variants = readOrders(options['orders'])
+        except (OSError, ValueError) as error:
+            parser.error('%s: %s' % (options['orders'], error))
+    else:
+        name, build = PARTS[part]
+        output = options.pop('output') or name + '.stl'
+        params = inspect.signature(build).parameters
+        vary = {}
+        for item in options.pop('vary'):
+            key, _, values = item.partition('=')
+            if key not in params:
+                parser.error('%s has no parameter %s' % (part, key))
+            try:
+                vary[key] = [paramType(params[key])(value) for value in values.split(',')]
+            except ValueError as error:
+                parser.error('--vary %s: %s' % (item, error))
+        if not vary:
+            with threadWorkers(processes):
+                triangles, problems = writePart(part, inspect.signature(build).bind(**options).args, output, stream)
+            for problem in problems:
+                print('Warning: ' + problem)
+            print('Wrote ' + output)
+        else:
+            variants = [(part, args, None, 1) for args in sweepVariants(options, vary)]
+    if part == 'sweep' or vary:
+        manifest, rows = sweep(variants, outdir, processes, stream)
+        print('Wrote %d files and %s' % (len(rows), manifest))
+    if stages == '-':
+        print(stopStageLog().table())
+    elif stages:
+        with open(stages, 'w') as f:
+            json.dump(stopStageLog().records, f, indent=1)
+        print('Wrote ' + stages)
+
+if __name__ == '__main__':
+    # Blender has already imported bpy when it runs this script.
+    if 'bpy' in sys.modules:
+        createParts([
+            # The Blade Holder should have a thread radius of 18.5 and 17.2 in order to  hold the circuit board holder correctly.
+            ('bladeholder', (256, 2, 18.5, 17.2, 0.8, 0.2, 0.8, 0.3, 2, 3)),
+            #('cpfemale', (256, 3, 3, 18.5, 17.2, 30.0, 28.7, 0.8, 0.2, 0.8, 0.3, 1)),
+            #('cpmale', (256, 3, 3, 19.0, 17.7, 29.5, 28.2, 0.8, 0.2, 0.8, 0.3, 2)),
+            ('hilt', (256, 3, 5, 19.5, 18.2, 0.8, 0.2, 0.8, 0.3, 0.5, 2, 2, False)),
+            ('pommel', (256, 5, 19.5, 18.2, 0.8, 0.2, 0.8, 0.3, 2)),
+        ], cache=PartCache())
+        # For a quick look while trying out parameters pass preview=True (or
+        # preview='envelopes' to skip the threads) above, then write the
+        # parts at full resolution with
+        #exportParts('//stl', cache=PartCache())
+        # A class set of the same parts, sharing one mesh per part and laid
+        # out on 220 x 220 mm print beds:
+        #createParts([('hilt', DEFAULTS['hilt'])] * 30 + [('pommel', DEFAULTS['pommel'])] * 30, cache=PartCache(), bed=(220, 220))
+        # To see where the time goes, call startStageLog() before making the
+        # parts and print(stopStageLog().table()) after; the table shows up
+        # in Blender's system console.
+    else:
+        main()
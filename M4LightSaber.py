@@ -14,18 +14,26 @@ GNU General Public License for more details.
 You should have received a copy of the GNU General Public License
 along with this program.  If not, see <https://www.gnu.org/licenses/>.
 '''
+import array
+import audiomixer
 import board
-import time
+import gc
+import math
+import os
 import neopixel
+import neopixel_write
 import digitalio
 import busio
 import adafruit_lis3dh
 import random
+import struct
+import supervisor
+from adafruit_bus_device.i2c_device import I2CDevice
 
 try:
-    from audiocore import WaveFile
+    from audiocore import RawSample, WaveFile
 except ImportError:
-    from audioio import WaveFile
+    from audioio import RawSample, WaveFile
 
 try:
     from audioio import AudioOut
@@ -35,36 +43,283 @@ except ImportError:
     except ImportError:
         pass  # not always supported by every board!
 
+try:
+    import keypad
+except ImportError:
+    keypad = None  # before CircuitPython 7 the button is polled instead
+
+try:
+    from ulab import numpy as np
+except ImportError:
+    np = None  # the motion is worked out one sample at a time instead
+
 # define constants
 COLOR=(0,0,255)
 NUM_PIXELS = 131
 NEOPIXEL_PIN = board.D5
 POWER_PIN = board.D10
 SWITCH_PIN = board.D9
+# how long in ms the blade flashes white on a clash
+FLASH_TIME = 50
+FLASH_COLOR = (255,255,255)
+# frames a second the blade is drawn at
+FRAME_RATE = 50
+FRAME_TIME = 1000 // FRAME_RATE
+# how much the lit blade flickers, from 0 for not at all to 1, and in how
+# many steps of brightness
+FLICKER = 0.1
+LEVELS = 16
+# print how much memory drawing the blade takes and the longest pass of the
+# main loop, where a garbage collection shows up, every few seconds
+RENDER_STATS = False
+# samples a second the accelerometer takes, and how many it collects before
+# they are read all together
+MOTION_RATE = 400
+WATERMARK = 16
+# m/s^2 the acceleration has to jump by from one sample to the next for a
+# clash, and the shortest time in ms between two clashes
+CLASH_THRESHOLD = 30
+CLASH_TIME = 200
+# how far on average, in m/s^2, the acceleration has to be from gravity over
+# the last SWING_TIME ms for a swing, which turns the hum up
+SWING_THRESHOLD = 5
+SWING_TIME = 250
+
+# Times are supervisor.ticks_ms(), whole milliseconds that keep their
+# precision however long the board has been on, unlike time.monotonic(). They
+# wrap around after 2**29 ms, so two of them are only ever compared through
+# ticksDiff.
+_TICKS_PERIOD = 1 << 29
+_TICKS_MAX = _TICKS_PERIOD - 1
+_TICKS_HALFPERIOD = _TICKS_PERIOD // 2
 
-# set up audio
+def ticksDiff(now, then):
+    # ms from then to now, negative while then is still to come
+    return ((now - then + _TICKS_HALFPERIOD) & _TICKS_MAX) - _TICKS_HALFPERIOD
+
+def ticksAdd(ticks, ms):
+    return (ticks + ms) & _TICKS_MAX
+
+# what the blade is doing
+OFF = 0
+IGNITING = 1
+ON = 2
+RETRACTING = 3
+
+# set up audio. Every sound must be a 22kHz, 16-bit, mono WAV file.
 audiofiles = ["sounds/LSOn.wav", "sounds/LSOff.wav", "sounds/LightSaberClash1.wav", "sounds/LightSaberClash2.wav",
               "sounds/LightSaberClash3.wav", "sounds/LightSaberClash4.wav"]
+# played over and over while the blade is lit, if there is one
+HUM_FILE = "sounds/LightSaberHum.wav"
+HUM_LEVEL = 0.5
+SAMPLE_RATE = 22050
 audio = AudioOut(board.A0)
+# The hum, the sounds of the blade going on and off and the clashes each
+# play on a voice of their own, mixed together, so a clash never cuts off the
+# hum or the ignition sound.
+mixer = audiomixer.Mixer(voice_count=3, sample_rate=SAMPLE_RATE, channel_count=1,
+                         bits_per_sample=16, samples_signed=True)
+humVoice = mixer.voice[0]
+effectVoice = mixer.voice[1]
+clashVoice = mixer.voice[2]
+humVoice.level = HUM_LEVEL
+audio.play(mixer)
+wave_file = None
+
+def loadSample(filename):
+    # A whole WAV file read into RAM, so it starts playing at once and never
+    # waits for the flash. Keep these short: a second takes 44KB.
+    with open(filename, "rb") as f:
+        f.seek(12)
+        while True:
+            chunk, size = struct.unpack("<4sI", f.read(8))
+            if chunk == b"data":
+                break
+            f.seek(size + (size & 1), 1)
+        # Made at its full size straight away, so there is only ever one copy
+        # of the samples in RAM.
+        samples = array.array("h", [0]) * (size // 2)
+        f.readinto(samples)
+    return RawSample(samples, sample_rate=SAMPLE_RATE)
+
+clashSamples = [loadSample(filename) for filename in audiofiles[2:]]
+
+try:
+    hum = WaveFile(open(HUM_FILE, "rb"))
+except OSError:
+    hum = None
 
-# Set up NeoPixels
-neopixels = neopixel.NeoPixel(NEOPIXEL_PIN, NUM_PIXELS, brightness=1)
-neopixels.fill((0,0,0))
-#neopixels.show()
+def soundLength(filename):
+    # ms a WAV file plays for, from its size and format.
+    with open(filename, "rb") as f:
+        wave = WaveFile(f)
+        bytesPerSecond = wave.sample_rate * wave.channel_count * wave.bits_per_sample // 8
+        wave.deinit()
+    return 1000 * (os.stat(filename)[6] - 44) // bytesPerSecond
 
-# Set up on/off button
-button = digitalio.DigitalInOut(SWITCH_PIN)
-button.switch_to_input(pull=digitalio.Pull.UP)
+# The blade takes exactly as long to extend and retract as their sounds.
+IGNITE_TIME = soundLength(audiofiles[0])
+RETRACT_TIME = soundLength(audiofiles[1])
+
+# Set up NeoPixels. The blade is drawn straight into the bytes sent to it,
+# 3 per pixel in the green, red, blue order the NeoPixels take, and everything
+# drawn with is worked out here at boot, so drawing a frame never allocates
+# memory and never sets off the garbage collector.
+GAMMA = bytes(round(255 * (i / 255) ** 2.6) for i in range(256))
+
+def paletteEntry(color, level):
+    return bytes(GAMMA[int(color[k] * level)] for k in (1, 0, 2))
+
+# COLOR at each step of flicker, from full brightness down, then FLASH_COLOR
+palette = b"".join(paletteEntry(COLOR, 1 - FLICKER * i / (LEVELS - 1)) for i in range(LEVELS)) + paletteEntry(FLASH_COLOR, 1)
+FLASH = LEVELS
+frame = bytearray(3 * NUM_PIXELS)
+# The first n pixels of the frame. A NeoPixel keeps its color until it is sent
+# a new one, so only the pixels up to the last one that changed are sent.
+frameStarts = [memoryview(frame)[:3 * n] for n in range(NUM_PIXELS + 1)]
+neopixelPin = digitalio.DigitalInOut(NEOPIXEL_PIN)
+neopixelPin.direction = digitalio.Direction.OUTPUT
+neopixel_write.neopixel_write(neopixelPin, frame)
+
+# Set up on/off button. keypad watches it in the background, so a press is
+# never missed however busy the loop is.
+if keypad:
+    buttons = keypad.Keys((SWITCH_PIN,), value_when_pressed=False, pull=True)
+    event = keypad.Event()
+else:
+    button = digitalio.DigitalInOut(SWITCH_PIN)
+    button.switch_to_input(pull=digitalio.Pull.UP)
 prevPress = False
-on = False
-clashNum = 2
+state = OFF
+# when the blade started moving, and how much of it is lit, from 0 to 1
+stateStart = supervisor.ticks_ms()
+extent = 0
+flashUntil = None
+nextFrame = stateStart
+# the number of pixels lit and their palette entry in the frame last sent
+shownLit = 0
+shownEntry = -1
+clashNum = 0
 
-# Set up accelerometer on I2C bus, 4G range:
+# Set up accelerometer on I2C bus, 8G range. It keeps its samples in its
+# FIFO and raises int1 once WATERMARK of them are waiting, so the main loop
+# only watches the pin and then reads them all in one go.
 i2c = busio.I2C(board.SCL, board.SDA)
 int1 = digitalio.DigitalInOut(board.D6)
 lis3dh = adafruit_lis3dh.LIS3DH_I2C(i2c, int1=int1)
 lis3dh.range = adafruit_lis3dh.RANGE_8_G
-lis3dh.set_tap(1, 90, time_limit=4, time_latency=50, time_window=255)
+lis3dh.data_rate = adafruit_lis3dh.DATARATE_400_HZ
+# m/s^2 per count at 8G
+SCALE = adafruit_lis3dh.STANDARD_GRAVITY / 4096
+
+# LIS3DH registers and bits for its FIFO
+CTRL_REG3 = 0x22
+I1_WTM = 0x04
+CTRL_REG5 = 0x24
+FIFO_EN = 0x40
+OUT_X_L = 0x28
+AUTO_INCREMENT = 0x80
+FIFO_CTRL_REG = 0x2E
+FIFO_BYPASS = 0x00
+FIFO_STREAM = 0x80
+FIFO_SRC_REG = 0x2F
+FIFO_OVERRUN = 0x40
+FIFO_SAMPLES = 0x1F
+
+lis3dhDevice = I2CDevice(i2c, 0x18)
+register = bytearray(2)
+# room for a full FIFO of 32 samples of x, y and z
+fifo = bytearray(6 * 32)
+
+def writeRegister(address, value):
+    register[0] = address
+    register[1] = value
+    with lis3dhDevice:
+        lis3dhDevice.write(register)
+
+def readRegister(address):
+    register[0] = address
+    with lis3dhDevice:
+        lis3dhDevice.write_then_readinto(register, register, out_end=1, in_start=1)
+    return register[1]
+
+def readFifo():
+    # Reads every sample waiting into fifo and returns how many there were.
+    status = readRegister(FIFO_SRC_REG)
+    count = 32 if status & FIFO_OVERRUN else status & FIFO_SAMPLES
+    if count:
+        # Reading on past the z axis goes back round to x of the next sample.
+        register[0] = OUT_X_L | AUTO_INCREMENT
+        with lis3dhDevice:
+            lis3dhDevice.write_then_readinto(register, fifo, out_end=1, in_end=6 * count)
+    return count
+
+def fifoValue(i):
+    # The i-th 16-bit value in fifo, worked out from its bytes rather than
+    # with struct, which would make a new tuple every time.
+    value = fifo[2 * i] | fifo[2 * i + 1] << 8
+    return value - 0x10000 if value & 0x8000 else value
+
+writeRegister(FIFO_CTRL_REG, FIFO_BYPASS)
+writeRegister(CTRL_REG5, readRegister(CTRL_REG5) | FIFO_EN)
+writeRegister(FIFO_CTRL_REG, FIFO_STREAM | WATERMARK)
+writeRegister(CTRL_REG3, I1_WTM)
+
+# Both versions of burstMotion give the largest squared jump in acceleration
+# between two samples, counting from the last sample of the burst before, and
+# the sum of the squares of how far each sample is from gravity.
+if np:
+    # Made once and filled in place every burst: fifo as rows of x, y and z,
+    # the last sample of the burst before followed by the burst in m/s^2, and
+    # room to work out the steps between them. Only the short sums of each
+    # row are new arrays.
+    raw = np.frombuffer(fifo, dtype=np.int16).reshape((32, 3))
+    samples = np.zeros((33, 3))
+    samples[0, 2] = adafruit_lis3dh.STANDARD_GRAVITY
+    work = np.zeros((32, 3))
+
+    def burstMotion(count):
+        burst = samples[1:count + 1]
+        burst[:] = raw[:count]
+        burst *= SCALE
+        steps = work[:count]
+        steps[:] = burst
+        steps -= samples[:count]
+        steps *= steps
+        jump = np.max(np.sum(steps, axis=1))
+        steps[:] = burst
+        steps *= steps
+        offGravity = np.sqrt(np.sum(steps, axis=1)) - adafruit_lis3dh.STANDARD_GRAVITY
+        samples[0] = samples[count]
+        return jump, np.sum(offGravity * offGravity)
+else:
+    # The last sample of the burst before, updated in place.
+    previous = [0, 0, adafruit_lis3dh.STANDARD_GRAVITY]
+
+    def burstMotion(count):
+        px, py, pz = previous
+        jump = 0
+        energy = 0
+        for i in range(0, 3 * count, 3):
+            x = fifoValue(i) * SCALE
+            y = fifoValue(i + 1) * SCALE
+            z = fifoValue(i + 2) * SCALE
+            jump = max(jump, (x - px) ** 2 + (y - py) ** 2 + (z - pz) ** 2)
+            offGravity = math.sqrt(x * x + y * y + z * z) - adafruit_lis3dh.STANDARD_GRAVITY
+            energy += offGravity * offGravity
+            px, py, pz = x, y, z
+        previous[0] = px
+        previous[1] = py
+        previous[2] = pz
+        return jump, energy
+
+# burstMotion's energy and sample count for each of the bursts read over the
+# last SWING_TIME ms
+windowEnergy = [0] * max(round(SWING_TIME * MOTION_RATE / WATERMARK / 1000), 1)
+windowSamples = [0] * len(windowEnergy)
+windowIndex = 0
+swinging = False
+nextClash = supervisor.ticks_ms()
 
 enable = digitalio.DigitalInOut(POWER_PIN)
 enable.direction = digitalio.Direction.OUTPUT
@@ -74,77 +329,204 @@ redled = digitalio.DigitalInOut(board.D13)
 redled.direction = digitalio.Direction.OUTPUT
 led = neopixel.NeoPixel(board.NEOPIXEL, 1);
 led.brightness = 0.2
+BLACK = (0,0,0)
+YELLOW = (255,255,0)
+CYAN = (0,255,255)
+MAGENTA = (255,0,255)
+tint = BLACK
 
 redled.value = False
 def play_file(filename):
+    # Start playing a sound and return straight away; audioTask closes the
+    # file once it has finished. A sound still playing is cut off.
+    global wave_file
+    stop_file()
     print("Playing file: " + filename)
     wave_file = open(filename, "rb")
-    with WaveFile(wave_file) as wave:
-        audio.play(wave)
-        while audio.playing:
-            pass
+    effectVoice.play(WaveFile(wave_file))
+
+def play_sample(sample):
+    clashVoice.play(sample)
+
+def stop_file():
+    global wave_file
+    if wave_file is not None:
+        effectVoice.stop()
         wave_file.close()
-    print("Finished")
+        wave_file = None
 
-def lightSaberOn():
-    i = 0
+def lightSaberOn(now):
+    global state, stateStart
+    # Starting from as far out as the blade already is.
+    state = IGNITING
+    stateStart = ticksAdd(now, -round(extent * IGNITE_TIME))
     enable.value = True
-    wave_file = open(audiofiles[0], "rb")
     redled.value = True
-    with WaveFile(wave_file) as wave:
-        audio.play(wave)
-        while audio.playing:
-            neopixels[i] = (0,0,255)
-            i = (i + 1) % NUM_PIXELS
-        wave_file.close()
-    print("Finished")
+    play_file(audiofiles[0])
+    if hum is not None and not humVoice.playing:
+        humVoice.play(hum, loop=True)
 
-def lightSaberOff():
-    wave_file = open(audiofiles[1], "rb")
+def lightSaberOff(now):
+    global state, stateStart
+    state = RETRACTING
+    stateStart = ticksAdd(now, -round((1 - extent) * RETRACT_TIME))
     redled.value = False
-    i = NUM_PIXELS - 1
-    with WaveFile(wave_file) as wave:
-        audio.play(wave)
-        while audio.playing:
-            neopixels[i] = (0,0,0)
-            i = (i - 1)
-            if i < 0:
-                i = 0
-        wave_file.close()
-    enable.value = False
-    print("Finished")
+    play_file(audiofiles[1])
 
-def flashOnClash():
-    global clashNum
-    wave_file = open(audiofiles[clashNum], "rb")
-    with WaveFile(wave_file) as wave:
-        audio.play(wave)
-        neopixels.fill((255,255,255))
-        led.fill((255,255,255))
-        while audio.playing:
-            neopixels.fill((0,0,255))
-            led.fill((0,0,255))
-        wave_file.close()
-    clashNum = random.randint(2,5)
+def flashOnClash(now):
+    global clashNum, flashUntil
+    # The lit part of the blade flashes and clashes, even while it is still
+    # igniting.
+    play_sample(clashSamples[clashNum])
+    led.fill(FLASH_COLOR)
+    flashUntil = ticksAdd(now, FLASH_TIME)
+    clashNum = random.randint(0, len(clashSamples) - 1)
 
-while True:
-    x,y,z = lis3dh.acceleration
-    if lis3dh.tapped and on:
-        flashOnClash()
+# The main loop runs each of these tasks in turn, over and over. A task does
+# whatever is due at the time it is given and returns at once, so none of
+# them ever waits for another.
+
+def buttonTask(now):
+    global prevPress
+    if keypad:
+        pressed = buttons.events.get_into(event) and event.pressed
+    else:
+        pressed = not button.value and not prevPress
+        prevPress = not button.value
+    if pressed:
+        # A press while the blade is still moving sends it back the other way.
+        if state == OFF or state == RETRACTING:
+            lightSaberOn(now)
+        else:
+            lightSaberOff(now)
+
+def motionTask(now):
+    global tint, windowIndex, swinging, nextClash
+    # Nothing to do until the accelerometer has a burst of samples waiting.
+    if not int1.value:
+        return
+    count = readFifo()
+    if count == 0:
+        return
+    jump, energy = burstMotion(count)
+    if jump > CLASH_THRESHOLD ** 2 and ticksDiff(now, nextClash) >= 0 and state != OFF and state != RETRACTING:
+        flashOnClash(now)
+        nextClash = ticksAdd(now, CLASH_TIME)
+        tint = FLASH_COLOR
+    windowEnergy[windowIndex] = energy
+    windowSamples[windowIndex] = count
+    windowIndex = (windowIndex + 1) % len(windowEnergy)
+    swing = sum(windowEnergy) > SWING_THRESHOLD ** 2 * sum(windowSamples)
+    if swing != swinging:
+        swinging = swing
+        humVoice.level = 1 if swing else HUM_LEVEL
+    if flashUntil is not None:
+        return
+    x = fifoValue(3 * count - 3) * SCALE
+    y = fifoValue(3 * count - 2) * SCALE
+    z = fifoValue(3 * count - 1) * SCALE
     if x > 8 and y < 1 and z < 1:
-        led[0] = (255,255,0)
+        color = YELLOW
     elif x < 1 and y > 8 and z < 1:
-        led[0] = (0,255,255)
+        color = CYAN
     elif x < 1 and y < 1 and z > 8:
-        led[0] = (255,0,255)
+        color = MAGENTA
     else:
-        led[0] = (0,0,0)
-    if not button.value and not prevPress:
-        if not on:
-            lightSaberOn()
-        else:
-            lightSaberOff()
-        prevPressfor = True
-        on = not on
-    elif button.value and prevPress:
-        prevPress = False
+        color = BLACK
+    if color is not tint:
+        tint = color
+        led[0] = color
+
+def audioTask(now):
+    if wave_file is None or effectVoice.playing:
+        return
+    stop_file()
+    print("Finished")
+
+def bladeTask(now):
+    # Draws a frame of the blade FRAME_RATE times a second and sends the
+    # pixels that changed. Every effect is worked out from the time, so the
+    # blade moves at the same speed however long the rest of the loop takes.
+    global state, extent, flashUntil, nextFrame, shownLit, shownEntry, renderFrames, renderBytes
+    if ticksDiff(now, nextFrame) < 0:
+        return
+    nextFrame = ticksAdd(nextFrame, FRAME_TIME)
+    if ticksDiff(now, nextFrame) > 0:
+        # Too far behind to catch up; skip the frames missed.
+        nextFrame = ticksAdd(now, FRAME_TIME)
+
+    if state == IGNITING:
+        extent = min(ticksDiff(now, stateStart) / IGNITE_TIME, 1)
+        if extent == 1:
+            state = ON
+    elif state == RETRACTING:
+        extent = max(1 - ticksDiff(now, stateStart) / RETRACT_TIME, 0)
+        if extent == 0:
+            state = OFF
+            humVoice.stop()
+
+    if RENDER_STATS:
+        free = gc.mem_free()
+    if flashUntil is not None and ticksDiff(now, flashUntil) < 0:
+        entry = FLASH
+    else:
+        flashUntil = None
+        # Two sines that never line up make a flicker that doesn't repeat,
+        # over the last 65 seconds only so the angles stay small enough to
+        # be exact.
+        t = (now & 0xFFFF) / 1000
+        entry = int((0.5 + 0.25 * math.sin(t * 45.9) + 0.25 * math.sin(t * 82.3)) * (LEVELS - 1) + 0.5)
+    lit = round(extent * NUM_PIXELS)
+    # A new color changes every lit pixel, otherwise only the ones the blade
+    # has grown or shrunk by change.
+    start = 0 if entry != shownEntry else min(lit, shownLit)
+    end = max(lit, shownLit)
+    if start < end:
+        g = palette[3 * entry]
+        r = palette[3 * entry + 1]
+        b = palette[3 * entry + 2]
+        for i in range(3 * start, 3 * lit, 3):
+            frame[i] = g
+            frame[i + 1] = r
+            frame[i + 2] = b
+        for i in range(3 * max(start, lit), 3 * end):
+            frame[i] = 0
+        neopixel_write.neopixel_write(neopixelPin, frameStarts[end])
+    shownLit = lit
+    shownEntry = entry
+    if RENDER_STATS:
+        renderFrames += 1
+        renderBytes += max(free - gc.mem_free(), 0)
+    if state == OFF:
+        # Only once the blade has gone dark.
+        enable.value = False
+
+renderFrames = 0
+renderBytes = 0
+lastPass = None
+longestPass = 0
+nextStats = supervisor.ticks_ms()
+
+def statsTask(now):
+    # Drawing should allocate 0 bytes; a pass of the main loop far longer than
+    # the rest is a garbage collection.
+    global renderFrames, renderBytes, lastPass, longestPass, nextStats
+    if lastPass is not None:
+        longestPass = max(longestPass, ticksDiff(now, lastPass))
+    lastPass = now
+    if ticksDiff(now, nextStats) < 0:
+        return
+    print("%d frames, %d bytes allocated drawing them, longest pass %d ms, %d bytes free" %
+          (renderFrames, renderBytes, longestPass, gc.mem_free()))
+    renderFrames = 0
+    renderBytes = 0
+    longestPass = 0
+    nextStats = ticksAdd(now, 5000)
+
+tasks = (buttonTask, motionTask, audioTask, bladeTask)
+if RENDER_STATS:
+    tasks += (statsTask,)
+while True:
+    now = supervisor.ticks_ms()
+    for task in tasks:
+        task(now)
@@ -0,0 +1,172 @@
+'''
+Copyright 2019, Daniel Stewart
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+'''
+# Times the part builders of LightSaberMaker.py outside Blender, e.g.
+#   python benchmark.py -o before.json
+# Every case also checks a hash of the geometry against benchmark_golden.json,
+# so a change that makes things faster can't quietly change the printed part.
+# After a change that is meant to alter the geometry, run it once with
+# --update-golden.
+import argparse
+import hashlib
+import inspect
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+import types
+import numpy as np
+
+GOLDEN = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmark_golden.json')
+
+def stubBpy():
+    # Just enough of bpy for createMeshFromData to run, copying the data the
+    # way Blender would so the ingest still costs something.
+    class Collection:
+        def __init__(self):
+            self.count = 0
+            self.data = {}
+        def add(self, count):
+            self.count += count
+        def foreach_set(self, attr, values):
+            self.data[attr] = np.array(values)
+    class Mesh:
+        def __init__(self, name):
+            self.name = name
+            self.vertices = Collection()
+            self.loops = Collection()
+            self.polygons = Collection()
+        def update(self, calc_edges=False):
+            pass
+    class Object(dict):
+        def __init__(self, name, data):
+            self.name = name
+            self.data = data
+        def select_set(self, state):
+            pass
+    bpy = types.ModuleType('bpy')
+    bpy.app = types.SimpleNamespace(version=(2, 90, 0))
+    bpy.data = types.SimpleNamespace(meshes=types.SimpleNamespace(new=Mesh), objects=types.SimpleNamespace(new=Object))
+    bpy.context = types.SimpleNamespace(collection=types.SimpleNamespace(objects=types.SimpleNamespace(link=lambda ob: None)))
+    return bpy
+
+if 'bpy' not in sys.modules:
+    sys.modules['bpy'] = stubBpy()
+import LightSaberMaker
+
+def geometryHash(mesh):
+    # Coordinates are rounded to 0.1 micron first, so the hash doesn't
+    # depend on the last bit of a platform's cos and sin.
+    digest = hashlib.sha256()
+    digest.update(np.round(np.asarray(mesh.verts, dtype=np.float64) * 1e4).astype(np.int64).tobytes())
+    digest.update(np.ascontiguousarray(mesh.faces, dtype=np.int32).tobytes())
+    digest.update(json.dumps(sorted(mesh.ngons.items())).encode())
+    return digest.hexdigest()[:16]
+
+def threadsCase(VerticesPerLoop, loops):
+    # One male thread on its own, the way compileOutline lays it out.
+    N = 5
+    mesh = LightSaberMaker.MeshBuffer(N * (VerticesPerLoop * loops + 1) + 2 * VerticesPerLoop, (N - 1) * VerticesPerLoop * loops + 2 * VerticesPerLoop)
+    LightSaberMaker.createThreads(VerticesPerLoop, mesh, 0, 0, loops, 19.5, 18.2, 0.8, 0.2, 0.8, 0.3, 1, 0)
+    return mesh
+
+def partCase(part, VerticesPerLoop, loops):
+    # The part as shipped, with every thread count set to loops.
+    build = LightSaberMaker.PARTS[part][1]
+    args = list(LightSaberMaker.DEFAULTS[part])
+    for i, name in enumerate(inspect.signature(build).parameters):
+        if name == 'VerticesPerLoop':
+            args[i] = VerticesPerLoop
+        elif name.startswith('num'):
+            args[i] = loops
+    return build(*args)
+
+def cases(sizes, loopCounts):
+    # (name, VerticesPerLoop, loops, function returning the mesh to hash)
+    for VerticesPerLoop in sizes:
+        for loops in loopCounts:
+            yield 'createThreads', VerticesPerLoop, loops, lambda v=VerticesPerLoop, l=loops: threadsCase(v, l)
+            for part in LightSaberMaker.PARTS:
+                yield part, VerticesPerLoop, loops, lambda p=part, v=VerticesPerLoop, l=loops: partCase(p, v, l)
+            # Blender ingest of a ready made hilt; only the ingest is timed.
+            hilt = partCase('hilt', VerticesPerLoop, loops)
+            yield 'createMeshFromData', VerticesPerLoop, loops, lambda m=hilt: (LightSaberMaker.createMeshFromData('Hilt', [0, 0, 0], m), m)[1]
+
+def run(function, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        best = min(best, time.perf_counter() - start)
+    tracemalloc.start()
+    function()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, best, peak
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Time the LightSaberMaker part builders and check their geometry.')
+    parser.add_argument('-o', '--output', default='benchmark.json', help='JSON file for the results (default: benchmark.json)')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[64, 256, 1024, 4096], help='VerticesPerLoop values to try')
+    parser.add_argument('--loops', type=int, nargs='+', default=[1, 3, 5], help='thread loop counts to try')
+    parser.add_argument('--repeat', type=int, default=3, help='runs per case; the fastest one counts')
+    parser.add_argument('--update-golden', action='store_true', help='store these hashes as the expected ones')
+    options = parser.parse_args(argv)
+
+    golden = {}
+    if os.path.exists(GOLDEN):
+        with open(GOLDEN) as f:
+            golden = json.load(f)
+    results = []
+    mismatches = 0
+    print('%-20s %6s %5s %10s %10s %8s %8s  %s' % ('case', 'verts', 'loops', 'ms', 'peak MB', 'V', 'F', 'hash'))
+    for name, VerticesPerLoop, loops, function in cases(options.sizes, options.loops):
+        mesh, seconds, peak = run(function, options.repeat)
+        key = '%s/%d/%d' % (name, VerticesPerLoop, loops)
+        digest = geometryHash(mesh)
+        if options.update_golden:
+            golden[key] = digest
+        match = golden.get(key)
+        if match is not None:
+            match = match == digest
+            mismatches += not match
+        results.append({'case': name, 'VerticesPerLoop': VerticesPerLoop, 'loops': loops, 'seconds': seconds,
+                        'peakBytes': peak, 'verts': len(mesh.verts), 'faces': len(mesh.faces), 'hash': digest, 'golden': match})
+        print('%-20s %6d %5d %10.2f %10.1f %8d %8d  %s%s' % (name, VerticesPerLoop, loops, seconds * 1000, peak / 2**20,
+              len(mesh.verts), len(mesh.faces), digest, {True: '', False: '  CHANGED', None: '  (no golden hash)'}[match]))
+
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, cwd=os.path.dirname(GOLDEN)).stdout.strip()
+    except OSError:
+        commit = ''
+    with open(options.output, 'w') as f:
+        json.dump({'commit': commit, 'python': platform.python_version(), 'numpy': np.__version__,
+                   'machine': platform.platform(), 'results': results}, f, indent=1)
+    print('Wrote ' + options.output)
+    if options.update_golden:
+        with open(GOLDEN, 'w') as f:
+            json.dump(golden, f, indent=1, sort_keys=True)
+        print('Wrote ' + GOLDEN)
+    if mismatches:
+        print('%d cases no longer make the same geometry' % mismatches)
+        return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,88 @@
+'''
+Copyright 2019, Daniel Stewart
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+'''
+# Checks that every part comes out as a closed, consistently wound mesh with
+# no doubled vertices or flat triangles, so it can go to the printer without
+# any cleaning up in Blender. Run: python -m pytest
+import inspect
+import numpy as np
+import pytest
+
+import LightSaberMaker
+
+def partArgs(part, VerticesPerLoop, loops, h2, h4):
+    # The part as shipped, with every thread count set to loops.
+    args = list(LightSaberMaker.DEFAULTS[part])
+    for i, name in enumerate(inspect.signature(LightSaberMaker.PARTS[part][1]).parameters):
+        if name == 'VerticesPerLoop':
+            args[i] = VerticesPerLoop
+        elif name.startswith('num'):
+            args[i] = loops
+        elif name == 'h2':
+            args[i] = h2
+        elif name == 'h4':
+            args[i] = h4
+    return args
+
+@pytest.mark.parametrize('chordError', [None, 0.05])
+@pytest.mark.parametrize('h2, h4', [(0.2, 0.3), (0, 0.3), (0.2, 0), (0, 0)])
+@pytest.mark.parametrize('loops', [1, 3, 5])
+@pytest.mark.parametrize('VerticesPerLoop', [18, 50, 99])
+@pytest.mark.parametrize('part', sorted(LightSaberMaker.PARTS))
+def test_manifold(part, VerticesPerLoop, loops, h2, h4, chordError):
+    mesh = LightSaberMaker.PARTS[part][1](*partArgs(part, VerticesPerLoop, loops, h2, h4), chordError=chordError)
+    assert LightSaberMaker.validateMesh(mesh) == []
+
+    # Every edge is used exactly twice, once each way.
+    triangles = mesh.triangles().astype(np.int64)
+    a = triangles.ravel()
+    b = np.roll(triangles, -1, axis=1).ravel()
+    edges = a * len(mesh.verts) + b
+    assert len(np.unique(edges)) == len(edges)
+    assert np.array_equal(np.sort(edges), np.sort(b * len(mesh.verts) + a))
+
+    # Every vertex is used, and no two of them are in the same place.
+    assert len(np.unique(triangles)) == len(mesh.verts)
+    assert len(np.unique(mesh.verts, axis=0)) == len(mesh.verts)
+
+    corners = mesh.verts[triangles].astype(np.float64)
+    area = np.linalg.norm(np.cross(corners[:, 1] - corners[:, 0], corners[:, 2] - corners[:, 0]), axis=1)
+    assert area.min() > 0
+
+@pytest.mark.parametrize('chordError', [None, 0.05])
+@pytest.mark.parametrize('chunkFaces', [1000, 1 << 16])
+@pytest.mark.parametrize('VerticesPerLoop, loops', [(18, 1), (50, 3)])
+@pytest.mark.parametrize('part', sorted(LightSaberMaker.PARTS))
+def test_stream(tmp_path, part, VerticesPerLoop, loops, chunkFaces, chordError):
+    # Streaming a part writes the same STL, byte for byte, as building it.
+    outline = LightSaberMaker.partOutline(part, partArgs(part, VerticesPerLoop, loops, 0.2, 0.3))[:-2] + (chordError, False)
+    LightSaberMaker.writeSTL(str(tmp_path / 'whole.stl'), LightSaberMaker.compileOutline(*outline))
+    LightSaberMaker.writeSTL(str(tmp_path / 'stream.stl'), LightSaberMaker.streamOutline(*outline, chunkFaces=chunkFaces))
+    assert (tmp_path / 'stream.stl').read_bytes() == (tmp_path / 'whole.stl').read_bytes()
+
+@pytest.mark.skipif(LightSaberMaker.shared_memory is None, reason='needs multiprocessing.shared_memory')
+def test_threadWorkers():
+    # Threads split between workers come out the same as made in one go.
+    args = partArgs('hilt', 4096, 10, 0.2, 0.3)
+    assert LightSaberMaker.threadSize(4096, 10, 0.2, 0.3)[2] >= LightSaberMaker.PARALLEL_FACES
+    serial = LightSaberMaker.buildPart('hilt', args)
+    with LightSaberMaker.threadWorkers(2):
+        assert LightSaberMaker.threadPool is not None
+        parallel = LightSaberMaker.buildPart('hilt', args)
+    assert np.array_equal(parallel.verts, serial.verts)
+    assert np.array_equal(parallel.faces, serial.faces)
+    assert parallel.ngons == serial.ngons
+    assert parallel.sections == serial.sections